@@ -0,0 +1,327 @@
+"""Analítica de tendencias sobre los reportes de pacientes (AtributosPacientes).
+
+Exporta incrementalmente los reportes completados a archivos columnares .npz
+particionados por fecha (reports/date=YYYY-MM-DD/part-*.npz) y calcula tendencias
+por paciente y de la cohorte con operaciones vectorizadas de NumPy.
+
+Uso:
+    python analytics.py export --backend postgres --dir reports
+    python analytics.py trends --dir reports --window 7
+"""
+import argparse
+import asyncio
+import json
+import os
+import unicodedata
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+COMPLETED_STAGE = 6
+EXPORTED_INDEX = "_exported_threads.txt"
+# Último checkpoint_id revisado: la siguiente exportación solo mira threads con checkpoints más nuevos
+EXPORT_WATERMARK = "_watermark.txt"
+
+# Categorías en el orden de los schemas; el código es el índice, -1 si no se reconoce
+ESTADO = ["muy mal", "mal", "regular", "bien", "muy bien"]
+EMOCIONES = ["alegria", "miedo", "tristeza", "frustracion", "rabia"]
+CALIDAD_SUENO = ["muy mala", "mala", "buena", "muy buena", "excelente"]
+SI_NO = ["no", "si"]
+
+Table = Dict[str, np.ndarray]
+
+
+def _plain(value: Any) -> str:
+    text = unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode()
+    return " ".join(text.lower().split())
+
+
+def _encode(values: Iterable[Any], categories: List[str]) -> np.ndarray:
+    index = {category: code for code, category in enumerate(categories)}
+    # Typos frecuentes del modelo que ya existen en reportes guardados
+    index.setdefault("excenlente", index.get("excelente", -1))
+    return np.array([index.get(_plain(v), -1) for v in values], dtype=np.int8)
+
+
+def _pain(values: Iterable[Any]) -> np.ndarray:
+    out = []
+    for v in values:
+        try:
+            out.append(float(str(v).split("/")[0].strip()))
+        except ValueError:
+            out.append(np.nan)
+    return np.array(out, dtype=np.float32)
+
+
+def reports_to_columns(reports: List[Dict[str, Any]]) -> Table:
+    """Convierte reportes (slots + metadatos) a columnas tipadas."""
+    slots = [r["slots"] for r in reports]
+    return {
+        "thread_id": np.array([r["thread_id"] for r in reports], dtype=str),
+        "user_id": np.array([str(s.get("user_id", r.get("user_id", ""))) for s, r in zip(slots, reports)], dtype=str),
+        "date": np.array([r["date"] for r in reports], dtype="datetime64[D]"),
+        "estado": _encode((s.get("estado") for s in slots), ESTADO),
+        "emociones": _encode((s.get("emociones") for s in slots), EMOCIONES),
+        "medicamentos": _encode((s.get("medicamentos") for s in slots), SI_NO),
+        "intensidad_dolor": _pain(s.get("intensidad_dolor") for s in slots),
+        "realiza_ejercicios": _encode((s.get("realiza_ejercicios") for s in slots), SI_NO),
+        "efecto_ejercicios": _encode((s.get("efecto_ejercicios") for s in slots), ESTADO),
+        "calidad_sueno": _encode((s.get("calidad_sueño", s.get("calidad_sueno")) for s in slots), CALIDAD_SUENO),
+    }
+
+
+def write_partitions(directory: str, table: Table) -> List[str]:
+    """Escribe un archivo nuevo por fecha; nunca reescribe particiones existentes."""
+    paths = []
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    for day in np.unique(table["date"]):
+        mask = table["date"] == day
+        partition = os.path.join(directory, f"date={day}")
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f"part-{stamp}.npz")
+        np.savez(path, **{column: values[mask] for column, values in table.items()})
+        paths.append(path)
+    return paths
+
+
+def load_reports(directory: str, start: Optional[date] = None, end: Optional[date] = None) -> Table:
+    """Carga las particiones dentro del rango [start, end] y concatena sus columnas."""
+    parts: Dict[str, List[np.ndarray]] = {}
+    if not os.path.isdir(directory):
+        return {}
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith("date="):
+            continue
+        day = date.fromisoformat(name[5:])
+        if (start and day < start) or (end and day > end):
+            continue
+        partition = os.path.join(directory, name)
+        for file in sorted(os.listdir(partition)):
+            with np.load(os.path.join(partition, file)) as data:
+                for column in data.files:
+                    parts.setdefault(column, []).append(data[column])
+    return {column: np.concatenate(chunks) for column, chunks in parts.items()}
+
+
+async def export_completed_reports(directory: str, backend: str) -> int:
+    """Exporta los reportes completados que aún no estén en el directorio.
+
+    Solo se leen los threads con checkpoints posteriores a la marca de la
+    exportación anterior, así que el costo crece con los reportes nuevos y no
+    con el historial completo.
+    """
+    from checkpointers import latest_checkpoints, open_checkpointer
+
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, EXPORTED_INDEX)
+    watermark_path = os.path.join(directory, EXPORT_WATERMARK)
+    exported = set()
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            exported = {line.strip() for line in f if line.strip()}
+    watermark = ""
+    if os.path.exists(watermark_path):
+        with open(watermark_path) as f:
+            watermark = f.read().strip()
+
+    reports = []
+    async with open_checkpointer(backend) as saver:
+        latest = await latest_checkpoints(saver, backend, after=watermark)
+        for thread_id, checkpoint_id in latest:
+            if thread_id in exported:
+                continue
+            checkpoint_tuple = await saver.aget_tuple(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": checkpoint_id}}
+            )
+            if checkpoint_tuple is None:
+                continue
+            values = checkpoint_tuple.checkpoint["channel_values"]
+            if int(values.get("stage", 1)) < COMPLETED_STAGE:
+                continue
+            reports.append({
+                "thread_id": thread_id,
+                "user_id": values.get("user_id", ""),
+                "date": checkpoint_tuple.checkpoint["ts"][:10],
+                "slots": values.get("slots", {}),
+            })
+    if reports:
+        write_partitions(directory, reports_to_columns(reports))
+        with open(index_path, "a") as f:
+            f.writelines(f"{r['thread_id']}\n" for r in reports)
+    # La marca se mueve después de escribir: si la exportación falla se reintenta completa
+    if latest:
+        with open(watermark_path, "w") as f:
+            f.write(latest[-1][1])
+    return len(reports)
+
+
+def _sorted_by_patient(table: Table):
+    """Ordena por (paciente, fecha) y devuelve el orden, los códigos de paciente y los ids."""
+    patients, codes = np.unique(table["user_id"], return_inverse=True)
+    order = np.lexsort((table["date"], codes))
+    return order, codes[order], patients
+
+
+def rolling_pain(table: Table, window: int = 7) -> np.ndarray:
+    """Media móvil de la intensidad del dolor sobre los últimos `window` reportes de cada paciente.
+
+    Devuelve un arreglo alineado con las filas originales de la tabla.
+    """
+    order, codes, _ = _sorted_by_patient(table)
+    pain = table["intensidad_dolor"][order].astype(np.float64)
+    valid = ~np.isnan(pain)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, pain, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    n = len(pain)
+    position = np.arange(n)
+    group_start = np.r_[0, np.flatnonzero(np.diff(codes)) + 1]
+    starts = np.repeat(group_start, np.diff(np.r_[group_start, n]))
+    low = np.maximum(position - window + 1, starts)
+    window_count = counts[position + 1] - counts[low]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rolling = (sums[position + 1] - sums[low]) / window_count
+    out = np.empty(n, dtype=np.float64)
+    out[order] = np.where(window_count > 0, rolling, np.nan)
+    return out
+
+
+def adherence_rate(table: Table) -> Dict[str, float]:
+    """Proporción de reportes con medicamentos tomados, por paciente."""
+    patients, codes = np.unique(table["user_id"], return_inverse=True)
+    medicamentos = table["medicamentos"]
+    answered = np.bincount(codes, weights=(medicamentos >= 0), minlength=len(patients))
+    taken = np.bincount(codes, weights=(medicamentos == 1), minlength=len(patients))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate = taken / answered
+    return dict(zip(patients.tolist(), rate.tolist()))
+
+
+def sleep_quality_distribution(table: Table, per_patient: bool = False) -> Dict[str, Any]:
+    """Distribución de la calidad de sueño de la cohorte (o por paciente)."""
+    quality = table["calidad_sueno"]
+    known = quality >= 0
+    if not per_patient:
+        counts = np.bincount(quality[known], minlength=len(CALIDAD_SUENO))
+        return dict(zip(CALIDAD_SUENO, counts.tolist()))
+    patients, codes = np.unique(table["user_id"], return_inverse=True)
+    flat = codes[known].astype(np.int64) * len(CALIDAD_SUENO) + quality[known]
+    matrix = np.bincount(flat, minlength=len(patients) * len(CALIDAD_SUENO)).reshape(len(patients), -1)
+    return {patient: dict(zip(CALIDAD_SUENO, row.tolist())) for patient, row in zip(patients.tolist(), matrix)}
+
+
+def exercise_streaks(table: Table) -> Dict[str, Dict[str, int]]:
+    """Rachas de días consecutivos con ejercicios realizados: actual y máxima por paciente."""
+    order, codes, patients = _sorted_by_patient(table)
+    days = table["date"][order].astype(np.int64)
+    exercised = table["realiza_ejercicios"][order] == 1
+    if len(days) == 0:
+        return {}
+    # Un día por paciente: varios reportes el mismo día cuentan una vez (ejercitó si alguno dice que sí)
+    first_of_day = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (days[1:] != days[:-1])])
+    exercised = np.logical_or.reduceat(exercised, first_of_day)
+    codes, days = codes[first_of_day], days[first_of_day]
+    n = len(days)
+    # Una racha se corta al cambiar de paciente, al no hacer ejercicio o al saltarse un día
+    continues = np.r_[False, (codes[1:] == codes[:-1]) & (days[1:] - days[:-1] == 1) & exercised[:-1]]
+    run_id = np.cumsum(~continues | ~exercised)
+    run_length = np.bincount(run_id, weights=exercised).astype(np.int64)
+    length_at_row = np.where(exercised, run_length[run_id], 0)
+    longest = np.zeros(len(patients), dtype=np.int64)
+    np.maximum.at(longest, codes, length_at_row)
+    last_row = np.r_[np.flatnonzero(np.diff(codes)), n - 1]
+    current = np.zeros(len(patients), dtype=np.int64)
+    current[codes[last_row]] = length_at_row[last_row]
+    return {
+        patient: {"current": int(c), "longest": int(m)}
+        for patient, c, m in zip(patients.tolist(), current, longest)
+    }
+
+
+def cohort_daily_pain(table: Table) -> Dict[str, float]:
+    """Intensidad media de dolor de la cohorte por día."""
+    days, codes = np.unique(table["date"], return_inverse=True)
+    pain = table["intensidad_dolor"].astype(np.float64)
+    valid = ~np.isnan(pain)
+    totals = np.bincount(codes, weights=np.where(valid, pain, 0.0), minlength=len(days))
+    counts = np.bincount(codes, weights=valid, minlength=len(days))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = totals / counts
+    return dict(zip((str(d) for d in days), mean.tolist()))
+
+
+def last_n_days_pain_summary(table: Table, user_id: str, days: int = 7, today: Optional[date] = None) -> Dict[str, Any]:
+    """Resumen del dolor de un paciente en los últimos `days` días, para la etapa de dolor."""
+    today = np.datetime64(today or date.today(), "D")
+    mask = (table["user_id"] == str(user_id)) & (table["date"] > today - days) & (table["date"] <= today)
+    pain = table["intensidad_dolor"][mask]
+    dates = table["date"][mask]
+    valid = ~np.isnan(pain)
+    pain, dates = pain[valid], dates[valid]
+    if pain.size == 0:
+        return {"reports": 0}
+    return {
+        "reports": int(pain.size),
+        "mean": round(float(pain.mean()), 2),
+        "max": float(pain.max()),
+        "last": float(pain[np.argmax(dates)]),
+    }
+
+
+def _json_safe(value: Any) -> Any:
+    """Convierte tipos de NumPy a JSON; NaN/inf (p.ej. pacientes sin datos) pasan a None."""
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="Exporta los reportes completados nuevos")
+    export.add_argument("--dir", default="reports")
+    export.add_argument("--backend", choices=["postgres", "sqlite"], default="postgres")
+    trends = subparsers.add_parser("trends", help="Calcula tendencias sobre los reportes exportados")
+    trends.add_argument("--dir", default="reports")
+    trends.add_argument("--window", type=int, default=7)
+    trends.add_argument("--days", type=int, default=None, help="Solo los últimos N días")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        count = asyncio.run(export_completed_reports(args.dir, args.backend))
+        print(f"Exported {count} new reports to {args.dir}")
+        return
+
+    start = date.today() - timedelta(days=args.days) if args.days else None
+    table = load_reports(args.dir, start=start)
+    if not table:
+        print("No reports found")
+        return
+    pain = rolling_pain(table, args.window)
+    order = np.lexsort((table["date"], table["user_id"]))
+    # Al recorrer en orden cronológico queda el valor más reciente de cada paciente
+    latest = {
+        user_id: None if np.isnan(value) else round(float(value), 2)
+        for user_id, value in zip(table["user_id"][order].tolist(), pain[order])
+    }
+    print(json.dumps(_json_safe({
+        "reports": int(len(table["user_id"])),
+        "rolling_pain_latest": latest,
+        "adherence_rate": adherence_rate(table),
+        "sleep_quality": sleep_quality_distribution(table),
+        "exercise_streaks": exercise_streaks(table),
+        "cohort_daily_pain": cohort_daily_pain(table),
+    }), ensure_ascii=False, indent=2, allow_nan=False))
+
+
+if __name__ == "__main__":
+    main()
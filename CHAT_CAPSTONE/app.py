@@ -4,115 +4,102 @@ import json
 import os
 from typing import AsyncGenerator, Dict, Any, Tuple
 from uuid import uuid4
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
 from langchain_core.callbacks import AsyncCallbackHandler
 from langchain_core.runnables import RunnableConfig
-from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from langgraph.graph.graph import CompiledGraph
-from psycopg_pool import AsyncConnectionPool
 from async_agent import graph
-from schemas import ChatMessage, UserInput, StreamInput
-import psycopg
+from checkpointers import REQUIRED_VARIABLES, checkpointer_backend, checkpointer_stats, open_checkpointer
+from hot_checkpointer import CheckpointPersistError, HotCheckpointer
+from normalization import extraction_stats_snapshot
+from patient_context import patient_context
+from middleware import AuthMiddleware, RequestIdMiddleware, TimingMiddleware, access_logger
+from coalescing import ThreadBusyError, ThreadRunRegistry, TurnRun, turn_fingerprint
+from schemas import BatchInput, ChatMessage, UserInput, StreamInput
 import logging
 
+CHECKPOINTER_BACKEND = checkpointer_backend()
+
 def check_environment_variables():
-    required_vars = ["DB_HOST", "DB_NAME", "DB_PORT"]
+    required_vars = REQUIRED_VARIABLES[CHECKPOINTER_BACKEND]
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     
     if missing_vars:
         raise EnvironmentError(f"Missing required environment variables: {', '.join(missing_vars)}")
     else:
+        print(f"Checkpointer backend: {CHECKPOINTER_BACKEND}")
         print("All required environment variables are set:")
         for var in required_vars:
             print(f"{var}: {os.getenv(var)}")
 
 check_environment_variables()
 
-DB_HOST = os.getenv("DB_HOST")
-DB_NAME = os.getenv("DB_NAME")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
+# Se lee una sola vez; AuthMiddleware compara en tiempo constante
+AUTH_SECRET = os.getenv("AUTH_SECRET")
+
+# Coalescing de turnos por thread_id: "wait" encola un mensaje distinto detrás
+# del turno en curso, "reject" responde 409 de inmediato.
+THREAD_BUSY_POLICY = os.getenv("THREAD_BUSY_POLICY", "wait")
+THREAD_BUSY_TIMEOUT = float(os.getenv("THREAD_BUSY_TIMEOUT", "60"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "600"))
 
-DB_URI = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode=require"
-DB_MAX_CONNECTIONS = 20
+# Cupo de turnos concurrentes compartido por todos los batches del proceso, para
+# que una importación masiva no acapare el pool de la DB ni el límite del LLM.
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
 
-connection_kwargs = {
-    "autocommit": True,
-    "prepare_threshold": 0,
-}
+# Log de acceso propio (método, ruta, status, duración, request_id). uvicorn ya
+# registra cada request, así que queda apagado salvo ACCESS_LOG=1.
+if os.getenv("ACCESS_LOG") == "1":
+    access_logger.setLevel(logging.INFO)
+    access_logger.addHandler(logging.StreamHandler())
 
-class TokenQueueStreamingHandler(AsyncCallbackHandler):
-    """LangChain callback handler for streaming LLM tokens to an asyncio queue."""
+class TokenPublishStreamingHandler(AsyncCallbackHandler):
+    """LangChain callback handler for publishing LLM tokens to a TurnRun."""
 
-    def __init__(self, queue: asyncio.Queue):
-        self.queue = queue
+    def __init__(self, run: TurnRun):
+        self.run = run
 
     async def on_llm_new_token(self, token: str, **kwargs) -> None:
         if token:
-            await self.queue.put(token)
+            await self.run.publish({"type": "token", "content": token})
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create the AsyncConnectionPool (using connection details without user and password)
-    async with AsyncConnectionPool(
-        conninfo=DB_URI,
-        max_size=DB_MAX_CONNECTIONS,
-        kwargs=connection_kwargs,
-    ) as pool:
-        # Create the AsyncPostgresSaver
-        checkpointer = AsyncPostgresSaver(pool)
-        
-        # Set up the checkpointer (uncomment this line the first time you run the app)
-        await checkpointer.setup()
-        
-        # Check if the checkpoints table exists
-        async with pool.connection() as conn:
-            async with conn.cursor() as cur:
-                try:
-                    await cur.execute("""
-                        SELECT EXISTS (
-                            SELECT FROM information_schema.tables 
-                            WHERE  table_schema = 'public'
-                            AND    table_name   = 'checkpoints'
-                        );
-                    """)
-                    table_exists = (await cur.fetchone())[0]
-                    
-                    if not table_exists:
-                        print("Checkpoints table does not exist. Running setup...")
-                        await checkpointer.setup()
-                    else:
-                        print("Checkpoints table already exists. Skipping setup.")
-                except psycopg.Error as e:
-                    print(f"Error checking for checkpoints table: {e}")
-
-        checkpointer = checkpointer
-        app.state.agent = graph.compile(checkpointer=checkpointer)
+    async with open_checkpointer(CHECKPOINTER_BACKEND) as checkpointer:
+        # Las sesiones WebSocket fijan su thread en memoria; el resto pasa directo al backend
+        app.state.checkpointer = HotCheckpointer(checkpointer)
+        app.state.agent = graph.compile(checkpointer=app.state.checkpointer)
+        app.state.runs = ThreadRunRegistry(
+            busy_policy=THREAD_BUSY_POLICY,
+            busy_timeout=THREAD_BUSY_TIMEOUT,
+            result_ttl=IDEMPOTENCY_TTL,
+        )
+        app.state.batch_slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
         yield
 
 app = FastAPI(lifespan=lifespan)
+# Middleware ASGI puro: a diferencia de @app.middleware("http") no envuelve la
+# respuesta en BaseHTTPMiddleware, así que no agrega tareas/colas por request ni
+# interfiere con la contrapresión de StreamingResponse en /stream.
+# El último agregado es el más externo: request-id -> timing -> auth.
+app.add_middleware(AuthMiddleware, secret=AUTH_SECRET, exempt_paths=("/health",))
+app.add_middleware(TimingMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 @app.get("/health")
 async def read_health():
     return {"status": "ok"}
 
-@app.middleware("http")
-async def check_auth_header(request: Request, call_next):
-    # Excluir el endpoint /health de la autenticación
-    if request.url.path == "/health":
-        return await call_next(request)
-    
-    auth_secret = os.getenv("AUTH_SECRET")
-    if auth_secret:
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
-            return Response(status_code=401, content="Missing or invalid token")
-        token = auth_header[7:]  # Eliminar "Bearer " del inicio
-        if token != auth_secret:
-            return Response(status_code=401, content="Invalid token")
-    return await call_next(request)
+@app.get("/metrics")
+async def read_metrics():
+    """Per-process counters: slot extractions per stage (clean, repaired locally or re-asked),
+    patient-context prefetch hits and, on Postgres, pool wait time and statement latency."""
+    return {
+        "extraction": extraction_stats_snapshot(),
+        "patient_context": patient_context.stats(),
+        "db": checkpointer_stats(CHECKPOINTER_BACKEND),
+    }
 
 def _parse_input(user_input: UserInput) -> Tuple[Dict[str, Any], str]:
     run_id = uuid4()
@@ -130,56 +117,77 @@ def _parse_input(user_input: UserInput) -> Tuple[Dict[str, Any], str]:
     )
     return kwargs, run_id
 
-@app.post("/invoke")
-async def invoke(user_input: UserInput) -> ChatMessage:
+async def _run_turn(
+    kwargs: Dict[str, Any], user_input: UserInput, stream_tokens: bool, run: TurnRun, log_updates: bool = False
+) -> None:
+    """Ejecuta un turno del grafo publicando tokens y mensajes nuevos en el TurnRun."""
     agent: CompiledGraph = app.state.agent
-    kwargs, run_id = _parse_input(user_input)
+    if stream_tokens:
+        kwargs["config"]["callbacks"] = [TokenPublishStreamingHandler(run)]
+    final_state = None
     try:
-        response_state = await agent.ainvoke(**kwargs)
-        latest_message = response_state["messages"][-1]
-        output = ChatMessage.from_langchain(latest_message)
-        output.run_id = str(run_id)
-        return output
+        async for mode, chunk in agent.astream(**kwargs, stream_mode=["updates", "values"]):
+            if mode == "values":
+                final_state = chunk
+                continue
+            if log_updates:
+                print(chunk, flush = True)
+            for _, state in chunk.items():
+                if not isinstance(state, dict) or 'messages' not in state:
+                    continue
+                for message in state['messages']:
+                    try:
+                        chat_message = ChatMessage.from_langchain(message)
+                        chat_message.run_id = run.run_id
+                    except Exception as e:
+                        await run.publish({'type': 'error', 'content': f'Error parsing message: {e}'})
+                        continue
+                    if chat_message.type == "human" and chat_message.content == user_input.message:
+                        continue
+                    await run.publish({'type': 'message', 'content': chat_message.dict()})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        await run.publish({'type': 'error', 'content': str(e)})
+        await run.finish(error=str(e))
+        return
+    output = ChatMessage.from_langchain(final_state["messages"][-1])
+    output.run_id = run.run_id
+    await run.finish(result=output)
 
-async def message_generator(user_input: StreamInput) -> AsyncGenerator[str, None]:
-    agent: CompiledGraph = app.state.agent
+async def _submit_turn(user_input: UserInput, stream_tokens: bool, log_updates: bool = False) -> TurnRun:
+    """Inicia un turno o se adjunta al turno equivalente que ya está en curso."""
     kwargs, run_id = _parse_input(user_input)
-    output_queue = asyncio.Queue(maxsize=10)
-    if user_input.stream_tokens:
-        kwargs["config"]["callbacks"] = [TokenQueueStreamingHandler(queue=output_queue)]
-    async def run_agent_stream():
-        try:
-            async for state_update in agent.astream(**kwargs, stream_mode="updates"):
-                print(state_update, flush = True)
-                await output_queue.put(state_update)
-        except Exception as e:
-            await output_queue.put({'error': str(e)})
-        finally:
-            await output_queue.put(None)
-    stream_task = asyncio.create_task(run_agent_stream())
-
-    while state_update := await output_queue.get():
-        if isinstance(state_update, str):
-            yield f"data: {json.dumps({'type': 'token', 'content': state_update})}\n\n"
-            continue
-        new_messages = []
-        for _, state in state_update.items():
-            if 'messages' in state:
-                new_messages.extend(state['messages'])
-        for message in new_messages:
-                try:
-                    chat_message = ChatMessage.from_langchain(message)
-                    chat_message.run_id = str(run_id)
-                except Exception as e:
-                    yield f"data: {json.dumps({'type': 'error', 'content': f'Error parsing message: {e}'})}\n\n"
-                    continue
-                if chat_message.type == "human" and chat_message.content == user_input.message:
-                    continue
-                yield f"data: {json.dumps({'type': 'message', 'content': chat_message.dict()})}\n\n"
+    thread_id = kwargs["config"]["configurable"]["thread_id"]
+    fingerprint = turn_fingerprint(
+        str(user_input.user_id), user_input.message, user_input.model, user_input.idempotency_key
+    )
+    registry: ThreadRunRegistry = app.state.runs
+    # El contexto del paciente se consulta mientras arranca el grafo, no después
+    # de una primera llamada al modelo; solo para threads nuevos en este proceso
+    prefetch = patient_context.start(thread_id, kwargs["input"]["user_id"])
+    try:
+        run, _ = await registry.submit(
+            thread_id,
+            fingerprint,
+            str(run_id),
+            lambda run: _run_turn(kwargs, user_input, stream_tokens, run, log_updates),
+        )
+    except ThreadBusyError as e:
+        if prefetch is not None:
+            patient_context.discard(thread_id, prefetch)
+        raise HTTPException(status_code=409, detail=str(e))
+    return run
 
-    await stream_task
+@app.post("/invoke")
+async def invoke(user_input: UserInput) -> ChatMessage:
+    run = await _submit_turn(user_input, stream_tokens=False)
+    output = await run.wait_result()
+    if run.error is not None:
+        raise HTTPException(status_code=500, detail=run.error)
+    return output
+
+async def message_generator(run: TurnRun) -> AsyncGenerator[str, None]:
+    async for event in run.subscribe():
+        yield f"data: {json.dumps(event)}\n\n"
     yield "data: [DONE]\n\n"
 
 
@@ -190,5 +198,128 @@ async def stream_agent(user_input: StreamInput):
 
     Use thread_id to persist and continue a multi-turn conversation. run_id kwarg
     is also attached to all messages for recording feedback.
+
+    A duplicate submission on the same thread_id (same message or same
+    idempotency_key) attaches to the in-flight turn instead of starting a new one.
     """
-    return StreamingResponse(message_generator(user_input), media_type="text/event-stream")
+    run = await _submit_turn(user_input, stream_tokens=user_input.stream_tokens, log_updates=True)
+    return StreamingResponse(message_generator(run), media_type="text/event-stream")
+
+
+async def batch_generator(batch: BatchInput) -> AsyncGenerator[str, None]:
+    # Los turnos de un mismo thread se ejecutan en orden; los threads distintos en paralelo
+    groups: Dict[str, list] = {}
+    for index, item in enumerate(batch.items):
+        if item.thread_id is None:
+            item.thread_id = str(uuid4())
+        groups.setdefault(item.thread_id, []).append((index, item))
+    limit = asyncio.Semaphore(min(batch.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def run_group(items: list) -> None:
+        # Cada ítem del grupo debe producir su línea: si no, el for de abajo espera para siempre
+        pending = list(items)
+        try:
+            async with limit, app.state.batch_slots:
+                while pending:
+                    index, item = pending[0]
+                    line = {"index": index, "thread_id": item.thread_id}
+                    try:
+                        run = await _submit_turn(item, stream_tokens=False)
+                        output = await run.wait_result()
+                        if run.error is not None:
+                            line.update(status="error", error=run.error)
+                        else:
+                            line.update(status="ok", result=output.dict())
+                    except HTTPException as e:
+                        line.update(status="error", error=e.detail)
+                    except Exception as e:
+                        line.update(status="error", error=str(e) or repr(e))
+                    pending.pop(0)
+                    await results.put(line)
+        except Exception as e:
+            for index, item in pending:
+                await results.put({"index": index, "thread_id": item.thread_id, "status": "error", "error": str(e) or repr(e)})
+
+    tasks = [asyncio.create_task(run_group(items)) for items in groups.values()]
+    try:
+        for _ in range(len(batch.items)):
+            yield json.dumps(await results.get()) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/batch/invoke")
+async def batch_invoke(batch: BatchInput):
+    """
+    Run many conversation turns in one request, e.g. imported survey answers.
+
+    Returns NDJSON, one line per item in completion order with its index, thread_id
+    and either the final message or the error for that item.
+    """
+    return StreamingResponse(batch_generator(batch), media_type="application/x-ndjson")
+
+
+@app.websocket("/ws")
+async def websocket_session(websocket: WebSocket):
+    """
+    Persistent session over a single WebSocket.
+
+    The connection is authenticated once at the handshake by AuthMiddleware
+    (Authorization header, or `Sec-WebSocket-Protocol: bearer, <token>` from browsers;
+    never the query string, which ends up in access logs). Each client frame is a
+    StreamInput-shaped JSON object; the server answers with the same token/message/error
+    events as /stream followed by {"type": "done"}. The thread's checkpoint stays in
+    memory for the whole session and is persisted to the database in the background
+    while the turn streams; "done" is only sent once those writes are durable, and a
+    failed write is reported as an error event. Other replicas don't see the in-memory
+    copy, so a thread's turns must reach the pod holding its session (sticky routing
+    on thread_id).
+    """
+    await websocket.accept()
+    checkpointer: HotCheckpointer = app.state.checkpointer
+    thread_id = websocket.query_params.get("thread_id")
+    if thread_id:
+        checkpointer.pin(thread_id)
+    try:
+        while True:
+            try:
+                payload = await websocket.receive_json()
+                payload.setdefault("thread_id", thread_id)
+                user_input = StreamInput(**payload)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"type": "error", "content": f"Invalid input: {e}"})
+                continue
+            if user_input.thread_id is None:
+                user_input.thread_id = str(uuid4())
+            if thread_id != user_input.thread_id:
+                if thread_id:
+                    try:
+                        await checkpointer.release(thread_id)
+                    except CheckpointPersistError as e:
+                        await websocket.send_json({"type": "error", "content": str(e)})
+                thread_id = user_input.thread_id
+                checkpointer.pin(thread_id)
+            try:
+                run = await _submit_turn(user_input, stream_tokens=user_input.stream_tokens)
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "content": e.detail})
+                continue
+            async for event in run.subscribe():
+                await websocket.send_json(event)
+            try:
+                await checkpointer.flush(thread_id)
+            except CheckpointPersistError as e:
+                await websocket.send_json({"type": "error", "content": str(e)})
+            await websocket.send_json({"type": "done", "thread_id": thread_id, "run_id": run.run_id})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if thread_id:
+            try:
+                await checkpointer.release(thread_id)
+            except CheckpointPersistError as e:
+                print(e, flush=True)
@@ -2,7 +2,6 @@ import os
 from typing import Annotated, List, Dict, Any
 from typing_extensions import TypedDict
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode
 from langchain_openai import ChatOpenAI
 from langgraph.graph import END, StateGraph, START
 from langgraph.checkpoint.memory import MemorySaver
@@ -10,8 +9,11 @@ from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_core.messages import AIMessage, SystemMessage, HumanMessage, BaseMessage, ToolMessage
 from langchain.tools.render import format_tool_to_openai_function
 from utils import define_questionary_agent, define_questionary_agent_with_slots
+from normalization import normalize_slots, record_extraction
+from patient_context import PREFETCH_PATIENT_CONTEXT, is_verified, patient_context, verify_messages
 import operator
 import json
+from uuid import uuid4
 from prompts import *
 from schemas import *
 from tools import *
@@ -45,8 +47,17 @@ questionary_agent_sleep = define_questionary_agent_with_slots(
     questionary_agent_suffix_sleep, [save_patient_report]
 )
 
-tools = [get_patient_last_report, send_alert, save_patient_report, parse_estado_general, get_patient_last_report]
-tool_executor = ToolNode(tools)
+# Tools return_direct que se ejecutan dentro del nodo de la etapa que las llamó,
+# sin pasar por un nodo "tools" separado (cada salto es un super-step con su checkpoint)
+inline_tools = {tool.name: tool for tool in [get_patient_last_report, send_alert]}
+TOOL_CALL_ERROR_TEMPLATE = "Error: {error}\n Please fix your mistakes."
+# Veces que una etapa puede volver a preguntar por slots inválidos dentro de un turno
+MAX_REASKS = 2
+REASK_FALLBACK = "Disculpa, no logré entender tu respuesta. ¿Podrías repetirla con otras palabras?"
+# Rondas de tools inline por etapa en un turno; si el modelo sigue pidiéndolas
+# (p.ej. verify_selfreport en bucle) el turno termina con un mensaje fijo
+MAX_INLINE_TOOL_ROUNDS = 3
+INLINE_TOOLS_FALLBACK = "Disculpa, tuve un problema procesando tu respuesta. ¿Podrías repetirla?"
 
 class HealthAssistant(TypedDict):
     messages: Annotated[List[BaseMessage], operator.add]
@@ -65,8 +76,60 @@ def create_ai_message(questionary_response):
         )
     )
 
+async def _run_inline_tools(message):
+    """Ejecuta las tools inline pedidas en el mensaje y devuelve sus ToolMessage."""
+    tool_messages = []
+    for tool_call in message.tool_calls:
+        tool = inline_tools.get(tool_call["name"])
+        if tool is None:
+            content = TOOL_CALL_ERROR_TEMPLATE.format(error=f"{tool_call['name']} is not a valid tool")
+        else:
+            try:
+                content = str(await tool.ainvoke(tool_call["args"]))
+            except Exception as e:
+                content = TOOL_CALL_ERROR_TEMPLATE.format(error=repr(e))
+        tool_messages.append(ToolMessage(content=content, name=tool_call["name"], tool_call_id=tool_call["id"]))
+    return tool_messages
+
 async def process_questionary_agent(
     state, agent, next_stage, special_cases=None
+):
+    new_messages = []
+    reasks = 0
+    inline_rounds = 0
+    while True:
+        result = await _questionary_step(
+            {**state, "messages": state.get("messages", []) + new_messages}, agent, next_stage, special_cases
+        )
+        new_messages += result["messages"]
+        if result.pop("reask", False):
+            if reasks < MAX_REASKS:
+                reasks += 1
+                continue
+            # Sin más reintentos: se pregunta de nuevo sin pasar por el LLM
+            new_messages.append(AIMessage(content=REASK_FALLBACK))
+            break
+        last_message = result["messages"][-1]
+        if not (isinstance(last_message, AIMessage) and last_message.tool_calls):
+            break
+        tool_names = [tool_call["name"] for tool_call in last_message.tool_calls]
+        if tool_names[0] not in inline_tools:
+            break
+        if inline_rounds >= MAX_INLINE_TOOL_ROUNDS:
+            # Se descarta la llamada pendiente para no dejar un tool_call sin respuesta en el historial
+            new_messages.pop()
+            new_messages.append(AIMessage(content=INLINE_TOOLS_FALLBACK))
+            break
+        inline_rounds += 1
+        # Igual que antes al volver desde el nodo tools: con una tool inline la etapa
+        # responde de nuevo; con cualquier otra tool el turno termina.
+        new_messages += await _run_inline_tools(last_message)
+        if not all(name in inline_tools for name in tool_names):
+            break
+    return {**result, "messages": new_messages}
+
+async def _questionary_step(
+    state, agent, next_stage, special_cases=None
 ):
     while True:
         local_messages = state.get("messages", [])
@@ -95,6 +158,23 @@ async def process_questionary_agent(
             slots_loads = json.loads(
                 questionary_response.additional_kwargs['tool_calls'][0]['function']['arguments']
             )
+            normalized = normalize_slots(function_name, slots_loads)
+            if normalized.errors:
+                # Valores irreparables: la etapa vuelve a preguntar en el mismo turno
+                record_extraction(function_name, "reasked")
+                messages.append(ToolMessage(
+                    "Valores inválidos, no se guardaron. Pregunta de nuevo al paciente por: "
+                    + "; ".join(normalized.errors),
+                    tool_call_id=tool_call_id,
+                ))
+                return {
+                    "messages": messages,
+                    "slots": state.get("slots", {}),
+                    "stage": state.get("stage", 1),
+                    "reask": True,
+                }
+            record_extraction(function_name, "repaired" if normalized.repaired else "clean")
+            slots_loads = normalized.slots
             slots = state.get("slots", {})
             slots.update(slots_loads)
             messages.append(ToolMessage(slots_loads, tool_call_id=tool_call_id))
@@ -106,7 +186,7 @@ async def process_questionary_agent(
             return new_state
 
 # Definición de funciones para cada etapa del cuestionario
-async def questionary_agent_func_emotions(state):
+async def questionary_agent_func_emotions(state, config: RunnableConfig):
     if 'stage' not in state:
         state['stage'] = 1
     if 'slots' not in state:
@@ -114,6 +194,16 @@ async def questionary_agent_func_emotions(state):
     if 'messages' not in state:
         state['messages'] = []
 
+    # El contexto del paciente ya viene consultado (prefetch en app.py): se agrega
+    # como si el modelo hubiera llamado verify_selfreport y la etapa pregunta en una sola llamada
+    context_messages = []
+    if PREFETCH_PATIENT_CONTEXT and not is_verified(state['messages']):
+        thread_id = config.get("configurable", {}).get("thread_id")
+        user_id = str(state.get("user_id", ""))
+        report = await patient_context.take(thread_id, user_id)
+        context_messages = verify_messages(report, user_id, call_id=f"prefetch_{uuid4().hex[:12]}")
+        state = {**state, "messages": state['messages'] + context_messages}
+
     def handle_verify_selfreport(state, questionary_response, next_stage):
         messages = [
             AIMessage(
@@ -128,9 +218,10 @@ async def questionary_agent_func_emotions(state):
         }
         return new_state
     special_cases = {'verify_selfreport': handle_verify_selfreport}
-    return await process_questionary_agent(
+    result = await process_questionary_agent(
         state, questionary_agent_emotions, next_stage=2, special_cases=special_cases
     )
+    return {**result, "messages": context_messages + result["messages"]}
 
 async def questionary_agent_func_medications(state):
     return await process_questionary_agent(
@@ -187,37 +278,26 @@ def state_analyzer_questionary(state):
     }
     return stage_mapping.get(stage, END)
 
-def sandbox(state):
-    return state
-
-def route_chatbot_tools_emotions(state):
-    return route_chatbot_tools(state, current_stage=1, next_stage_name="medications", end_stage=2)
+def route_after_stage(state, end_stage, next_stage_name):
+    # La etapa avanzó: se pasa directo a la siguiente en el mismo turno
+    if int(state.get("stage", 1)) == end_stage:
+        return next_stage_name
+    return END
 
-def route_chatbot_tools_medications(state):
-    return route_chatbot_tools(state, current_stage=2, next_stage_name="pain", end_stage=3)
+def route_next_stage_emotions(state):
+    return route_after_stage(state, end_stage=2, next_stage_name="medications")
 
-def route_chatbot_tools_pain(state):
-    return route_chatbot_tools(state, current_stage=3, next_stage_name="exercise", end_stage=4)
+def route_next_stage_medications(state):
+    return route_after_stage(state, end_stage=3, next_stage_name="pain")
 
-def route_chatbot_tools_exercise(state):
-    return route_chatbot_tools(state, current_stage=4, next_stage_name="sleep", end_stage=5)
+def route_next_stage_pain(state):
+    return route_after_stage(state, end_stage=4, next_stage_name="exercise")
 
-def route_chatbot_tools_sleep(state):
-    return route_chatbot_tools(state, current_stage=5, next_stage_name=END, end_stage=6)
+def route_next_stage_exercise(state):
+    return route_after_stage(state, end_stage=5, next_stage_name="sleep")
 
-def route_tools_chatbot(state):
-    messages = state.get("messages", [])
-    last_m = messages[-1] if messages else None
-    name_to_route = {
-        "verify_selfreport": "emotions",
-        "send_alert": "pain",
-        "AtributosPacientes": "sleep",
-    }
-    if isinstance(last_m, ToolMessage):
-        tool_name = last_m.name
-        return name_to_route.get(tool_name, END)
-    else:
-        return END
+def route_next_stage_sleep(state):
+    return route_after_stage(state, end_stage=6, next_stage_name=END)
 
 workflow = StateGraph(HealthAssistant)
 workflow.add_node("emotions", questionary_agent_func_emotions)
@@ -225,63 +305,20 @@ workflow.add_node("medications", questionary_agent_func_medications)
 workflow.add_node("pain", questionary_agent_func_pain)
 workflow.add_node("exercise", questionary_agent_func_exercise)
 workflow.add_node("sleep", questionary_agent_func_sleep)
-workflow.add_node("tools", tool_executor)
-workflow.add_node("cuestionario", sandbox)
-workflow.add_conditional_edges("cuestionario", state_analyzer_questionary, {"emotions":"emotions", "medications":"medications", "sleep":"sleep", "exercise":"exercise", "pain":"pain", END:END})
 
-# Establecer el punto de entrada del flujo de trabajo de manera dinámica
-workflow.set_entry_point("cuestionario")
-
-# Añadir transiciones condicionales entre nodos
+# Cada turno entra directo a la etapa actual
 workflow.add_conditional_edges(
-    "emotions",
-    route_chatbot_tools_emotions,
-    {"medications": "medications", "tools": "tools", END: END}
-)
-workflow.add_conditional_edges(
-    "medications",
-    route_chatbot_tools_medications,
-    {"pain": "pain", "tools": "tools", END: END}
-)
-workflow.add_conditional_edges(
-    "pain",
-    route_chatbot_tools_pain,
-    {"exercise": "exercise", "tools": "tools", END: END}
-)
-workflow.add_conditional_edges(
-    "exercise",
-    route_chatbot_tools_exercise,
-    {"sleep": "sleep", "tools": "tools", END: END}
-)
-workflow.add_conditional_edges(
-    "sleep",
-    route_chatbot_tools_sleep,
-    {"tools": "tools", END: END}
-)
-workflow.add_conditional_edges(
-    "tools",
-    route_tools_chatbot,
+    START,
+    state_analyzer_questionary,
     {"emotions": "emotions", "medications": "medications", "pain": "pain", "exercise": "exercise", "sleep": "sleep", END: END}
 )
 
-def route_chatbot_tools(state, current_stage, next_stage_name, end_stage):
-    messages = state.get("messages", [])
-    stage = int(state.get("stage", 1))
-    last_message = messages[-1] if messages else None
-    if isinstance(last_message, AIMessage):
-        if not last_message.tool_calls and stage == current_stage:
-            return END
-        else:
-            if stage == end_stage:
-                return next_stage_name
-            else:
-                return "tools"
-    if isinstance(last_message, ToolMessage):
-        if stage == end_stage:
-            return next_stage_name
-        else:
-            return "tools"
-    return END
+# Añadir transiciones condicionales entre nodos
+workflow.add_conditional_edges("emotions", route_next_stage_emotions, {"medications": "medications", END: END})
+workflow.add_conditional_edges("medications", route_next_stage_medications, {"pain": "pain", END: END})
+workflow.add_conditional_edges("pain", route_next_stage_pain, {"exercise": "exercise", END: END})
+workflow.add_conditional_edges("exercise", route_next_stage_exercise, {"sleep": "sleep", END: END})
+workflow.add_conditional_edges("sleep", route_next_stage_sleep, {END: END})
 
 graph = workflow
 
@@ -0,0 +1,65 @@
+"""Tiempo de agregación de analytics.py sobre reportes sintéticos (1M+ por defecto).
+
+Uso:
+    python benchmarks/bench_analytics.py --reports 1000000 --patients 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import analytics  # noqa: E402
+
+
+def synthetic_table(reports: int, patients: int, days: int, seed: int = 7) -> analytics.Table:
+    rng = np.random.default_rng(seed)
+    pain = rng.integers(1, 11, reports).astype(np.float32)
+    pain[rng.random(reports) < 0.02] = np.nan
+    return {
+        "thread_id": np.char.add("t", np.arange(reports).astype(str)),
+        "user_id": rng.integers(0, patients, reports).astype(str),
+        "date": np.datetime64("2024-01-01") + rng.integers(0, days, reports),
+        "estado": rng.integers(-1, len(analytics.ESTADO), reports).astype(np.int8),
+        "emociones": rng.integers(-1, len(analytics.EMOCIONES), reports).astype(np.int8),
+        "medicamentos": rng.integers(-1, 2, reports).astype(np.int8),
+        "intensidad_dolor": pain,
+        "realiza_ejercicios": rng.integers(0, 2, reports).astype(np.int8),
+        "efecto_ejercicios": rng.integers(-1, len(analytics.ESTADO), reports).astype(np.int8),
+        "calidad_sueno": rng.integers(-1, len(analytics.CALIDAD_SUENO), reports).astype(np.int8),
+    }
+
+
+def timed(label: str, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    print(f"  {label:<28} {(time.perf_counter() - start) * 1000:9.1f}ms")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=1_000_000)
+    parser.add_argument("--patients", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    print(f"{args.reports} reports, {args.patients} patients, {args.days} days")
+    table = timed("generate", synthetic_table, args.reports, args.patients, args.days)
+    with tempfile.TemporaryDirectory() as tmp:
+        timed("write partitions", analytics.write_partitions, tmp, table)
+        table = timed("load partitions", analytics.load_reports, tmp)
+    timed("rolling pain (7 reports)", analytics.rolling_pain, table, 7)
+    timed("adherence rate", analytics.adherence_rate, table)
+    timed("sleep quality (cohort)", analytics.sleep_quality_distribution, table)
+    timed("sleep quality (per patient)", analytics.sleep_quality_distribution, table, True)
+    timed("exercise streaks", analytics.exercise_streaks, table)
+    timed("cohort daily pain", analytics.cohort_daily_pain, table)
+    timed("last 7 days pain (1 patient)", analytics.last_n_days_pain_summary, table, "1", 7)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Throughput de /batch/invoke contra el loop de llamadas /invoke una por una.
+
+Uso:
+    python benchmarks/bench_batch.py --url http://localhost:8080 --threads 50 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from uuid import uuid4
+
+import httpx
+
+# Respuestas importadas de una encuesta en papel, un thread por paciente
+SURVEY_TURNS = [
+    "me he sentido regular, con algo de tristeza",
+    "sí, tomé mis medicamentos, sin efectos adversos",
+]
+
+
+def build_items(threads: int, user_id: str) -> list:
+    items = []
+    for _ in range(threads):
+        thread_id = str(uuid4())
+        items.extend({"message": m, "thread_id": thread_id, "user_id": user_id} for m in SURVEY_TURNS)
+    return items
+
+
+async def per_call_loop(client: httpx.AsyncClient, items: list) -> int:
+    errors = 0
+    for item in items:
+        response = await client.post("/invoke", json=item)
+        errors += response.status_code != 200
+    return errors
+
+
+async def batch(client: httpx.AsyncClient, items: list, concurrency: int) -> int:
+    errors = 0
+    payload = {"items": items, "max_concurrency": concurrency}
+    async with client.stream("POST", "/batch/invoke", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line:
+                errors += json.loads(line)["status"] != "ok"
+    return errors
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--user-id", default="1")
+    args = parser.parse_args()
+    headers = {}
+    if os.getenv("AUTH_SECRET"):
+        headers["Authorization"] = f"Bearer {os.getenv('AUTH_SECRET')}"
+
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, timeout=None) as client:
+        items = build_items(args.threads, args.user_id)
+        start = time.perf_counter()
+        errors = await per_call_loop(client, items)
+        loop_elapsed = time.perf_counter() - start
+        print(f"per-call loop : {len(items) / loop_elapsed:7.2f} turns/s  ({loop_elapsed:.1f}s, {errors} errors)")
+
+        items = build_items(args.threads, args.user_id)
+        start = time.perf_counter()
+        errors = await batch(client, items, args.concurrency)
+        batch_elapsed = time.perf_counter() - start
+        print(f"batch         : {len(items) / batch_elapsed:7.2f} turns/s  ({batch_elapsed:.1f}s, {errors} errors)")
+        print(f"speedup       : {loop_elapsed / batch_elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""Micro-benchmark de los backends de checkpoints: latencia y throughput de put/get/list.
+
+Usa estados de tamaño realista (un reporte a medio completar: N mensajes y slots).
+Postgres solo se mide si están las variables DB_*.
+
+Uso:
+    python benchmarks/bench_checkpointers.py --backends sqlite memory --threads 50 --steps 20 --messages 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.base.id import uuid6
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from checkpointers import checkpointer_stats, open_checkpointer  # noqa: E402
+
+SLOTS = {
+    "estado": "regular",
+    "emociones": "tristeza",
+    "medicamentos": "si",
+    "efectos_adversos": "nauseas leves por la mañana",
+    "razon_no_medicamentos": "no aplica",
+    "intensidad_dolor": "6",
+}
+
+
+def build_messages(count: int) -> list:
+    messages = []
+    for i in range(count):
+        if i % 2 == 0:
+            messages.append(HumanMessage(content="Hoy me he sentido regular, con algo de dolor en la espalda " * 2))
+        else:
+            messages.append(AIMessage(content="Entiendo, gracias por contarme. ¿Podrías indicarme la intensidad del dolor? " * 3))
+    return messages
+
+
+def percentile(values: List[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def bench_backend(backend: str, threads: int, steps: int, messages: int, concurrency: int, sqlite_path: str) -> Dict[str, List[float]]:
+    timings: Dict[str, List[float]] = {"put": [], "get": [], "list": []}
+    semaphore = asyncio.Semaphore(concurrency)
+    async with open_checkpointer(backend, sqlite_path=sqlite_path) as saver:
+
+        async def run_thread(index: int) -> None:
+            async with semaphore:
+                config = {"configurable": {"thread_id": f"bench-{backend}-{index}-{uuid6()}", "checkpoint_ns": ""}}
+                checkpoint = empty_checkpoint()
+                version = None
+                for step in range(steps):
+                    version = saver.get_next_version(version, None)
+                    checkpoint = {
+                        **checkpoint,
+                        "id": str(uuid6()),
+                        "channel_values": {
+                            "messages": build_messages(min(messages, step + 1)),
+                            "slots": SLOTS,
+                            "stage": 1 + step % 5,
+                            "user_id": "1",
+                        },
+                        "channel_versions": {"messages": version, "slots": version, "stage": version},
+                    }
+                    metadata = {"source": "loop", "step": step, "writes": None, "parents": {}}
+                    start = time.perf_counter()
+                    config = await saver.aput(config, checkpoint, metadata, {"messages": version})
+                    timings["put"].append(time.perf_counter() - start)
+
+                    start = time.perf_counter()
+                    await saver.aget_tuple({"configurable": {"thread_id": config["configurable"]["thread_id"]}})
+                    timings["get"].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                async for _ in saver.alist({"configurable": {"thread_id": config["configurable"]["thread_id"]}}, limit=10):
+                    pass
+                timings["list"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_thread(i) for i in range(threads)))
+        timings["wall"] = [time.perf_counter() - start]
+        stats = checkpointer_stats(backend)
+        if stats:
+            print(f"  pool {stats['mode']} (prepare_threshold={stats['prepare_threshold']}): "
+                  f"size {stats['size']}, {stats['requests']} requests, {stats['requests_queued']} queued, "
+                  f"mean wait {stats['mean_wait_ms']:.2f}ms")
+            for key, values in stats["statements"].items():
+                print(f"  {key:<28} {values['count']:6d}x  mean {values['mean_ms']:.2f}ms  max {values['max_ms']:.2f}ms")
+    return timings
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["postgres", "sqlite", "memory"])
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=12, help="Mensajes máximos por estado")
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            if backend == "postgres" and not os.getenv("DB_HOST"):
+                print("postgres: skipped (DB_HOST not set)")
+                continue
+            print(f"{backend}:")
+            timings = await bench_backend(
+                backend, args.threads, args.steps, args.messages, args.concurrency, os.path.join(tmp, "bench.sqlite")
+            )
+            wall = timings.pop("wall")[0]
+            for op, values in timings.items():
+                print(f"  {op:<5} p50 {statistics.median(values) * 1000:7.2f}ms  p99 {percentile(values, 99) * 1000:7.2f}ms"
+                      f"  {len(values) / sum(values):9.0f} ops/s (serial)")
+            print(f"  total {wall:.2f}s for {args.threads * args.steps} checkpoints "
+                  f"({args.threads * args.steps / wall:.0f} puts/s with concurrency {args.concurrency})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
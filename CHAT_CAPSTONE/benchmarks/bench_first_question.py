@@ -0,0 +1,87 @@
+"""Tiempo hasta la primera pregunta real en un thread nuevo, con y sin prefetch del contexto del paciente.
+
+Usa el LLM fake de replay_llm con latencia simulada por llamada y una consulta
+de último reporte también con latencia simulada, para ver cuántos round trips
+seriales quedan antes de que el paciente reciba una pregunta.
+
+Uso:
+    python benchmarks/bench_first_question.py --threads 50 --llm-latency 0.4 --lookup-latency 0.15
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+
+from replay_llm import FakeQuestionaryChatModel, LLMUsageCallback  # noqa: E402
+from utils import set_llm_factory  # noqa: E402
+
+
+async def first_question(compiled, prefetch: bool, user_id: str = "1"):
+    """Segundos hasta el primer AIMessage con texto y sin tool calls, y llamadas al LLM del turno."""
+    import async_agent
+    from patient_context import patient_context
+
+    async_agent.PREFETCH_PATIENT_CONTEXT = prefetch
+    thread_id = str(uuid4())
+    usage = LLMUsageCallback()
+    config = {"configurable": {"thread_id": thread_id}, "callbacks": [usage]}
+    start = time.perf_counter()
+    elapsed = None
+    if prefetch:
+        # Lo mismo que hace app._submit_turn al recibir el request
+        patient_context.start(thread_id, user_id)
+    async for chunk in compiled.astream(
+        {"messages": [HumanMessage(content="hola")], "user_id": user_id}, config, stream_mode="updates"
+    ):
+        for update in chunk.values():
+            for message in (update or {}).get("messages", []):
+                if elapsed is None and isinstance(message, AIMessage) and message.content and not message.tool_calls:
+                    elapsed = time.perf_counter() - start
+    return elapsed, usage.calls
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="Segundos por llamada al modelo")
+    parser.add_argument("--lookup-latency", type=float, default=0.15, help="Segundos de la consulta de último reporte")
+    args = parser.parse_args()
+
+    class SlowFakeModel(FakeQuestionaryChatModel):
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(args.llm_latency)
+            return self._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    set_llm_factory(SlowFakeModel)
+    from async_agent import graph
+    from tools import get_patient_last_report
+
+    lookup = get_patient_last_report.func
+
+    def slow_lookup(user_id: int):
+        time.sleep(args.lookup_latency)
+        return lookup(user_id)
+
+    get_patient_last_report.func = slow_lookup
+    compiled = graph.compile(checkpointer=MemorySaver())
+
+    print(f"{args.threads} new threads, LLM {args.llm_latency * 1000:.0f}ms/call, lookup {args.lookup_latency * 1000:.0f}ms")
+    for label, prefetch in [("model calls verify_selfreport", False), ("prefetched patient context", True)]:
+        results = [await first_question(compiled, prefetch) for _ in range(args.threads)]
+        times = [elapsed for elapsed, _ in results if elapsed is not None]
+        calls = statistics.mean(calls for _, calls in results)
+        print(f"  {label:<31} p50 {statistics.median(times) * 1000:7.1f}ms  max {max(times) * 1000:7.1f}ms"
+              f"  LLM calls {calls:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""Super-steps, escrituras de checkpoint y overhead del grafo por turno.
+
+Corre un reporte completo con el LLM fake de replay_llm (sin llamadas a OpenAI),
+así que el tiempo medido es overhead del grafo y del checkpointer.
+
+Uso:
+    python benchmarks/bench_graph_steps.py --reports 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+
+from replay_llm import FakeQuestionaryChatModel, LLMUsageCallback  # noqa: E402
+from utils import set_llm_factory  # noqa: E402
+
+# Un turno por etapa más el saludo inicial
+REPORT_SCRIPT = ["hola", "bien, con alegría", "sí, sin efectos", "dolor 3", "sí, muy bien", "dormí 8 horas"]
+
+
+class CountingSaver(MemorySaver):
+    """MemorySaver que cuenta checkpoints (uno por super-step) y escrituras pendientes."""
+
+    def __init__(self):
+        super().__init__()
+        self.put_count = 0
+        self.write_count = 0
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        self.put_count += 1
+        return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id):
+        self.write_count += 1
+        return await super().aput_writes(config, writes, task_id)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=200)
+    args = parser.parse_args()
+
+    set_llm_factory(FakeQuestionaryChatModel)
+    from async_agent import graph
+
+    saver = CountingSaver()
+    compiled = graph.compile(checkpointer=saver)
+    turns, steps, llm_calls, durations = 0, 0, 0, []
+    for _ in range(args.reports):
+        usage = LLMUsageCallback()
+        config = {"configurable": {"thread_id": str(uuid4())}, "callbacks": [usage]}
+        for message in REPORT_SCRIPT:
+            start = time.perf_counter()
+            async for event in compiled.astream(
+                {"messages": [HumanMessage(content=message)], "user_id": "1"}, config, stream_mode="debug"
+            ):
+                steps += event["type"] == "checkpoint" and event["payload"]["metadata"]["source"] == "loop"
+            durations.append(time.perf_counter() - start)
+            turns += 1
+        llm_calls += usage.calls
+
+    print(f"{args.reports} reports, {turns} turns")
+    print(f"  super-steps / turn        {steps / turns:.2f}")
+    print(f"  checkpoint puts / turn    {saver.put_count / turns:.2f}")
+    print(f"  pending writes / turn     {saver.write_count / turns:.2f}")
+    print(f"  LLM calls / report        {llm_calls / args.reports:.2f}")
+    print(f"  graph overhead / turn     p50 {statistics.median(durations) * 1000:.2f}ms"
+          f"  mean {statistics.mean(durations) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""Compara el hook @app.middleware("http") anterior contra el stack ASGI puro.
+
+Levanta dos apps mínimas con uvicorn (una por variante) y mide, con el stack
+configurado igual que en app.py (log de acceso incluido si se pasa --access-log):
+- requests/seg sobre un endpoint autenticado con N clientes concurrentes
+- time-to-first-byte de un endpoint SSE
+
+Uso:
+    python benchmarks/bench_middleware.py --requests 5000 --concurrency 50 [--access-log]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from middleware import AuthMiddleware, RequestIdMiddleware, TimingMiddleware, access_logger  # noqa: E402
+
+SECRET = "bench-secret"
+
+
+def add_routes(app: FastAPI) -> None:
+    @app.get("/ping")
+    async def ping():
+        return {"status": "ok"}
+
+    @app.get("/sse")
+    async def sse():
+        async def events():
+            for i in range(20):
+                yield f"data: {i}\n\n"
+                await asyncio.sleep(0)
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def legacy_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def check_auth_header(request: Request, call_next):
+        if request.url.path == "/health":
+            return await call_next(request)
+        auth_secret = os.getenv("AUTH_SECRET")
+        if auth_secret:
+            auth_header = request.headers.get("Authorization")
+            if not auth_header or not auth_header.startswith("Bearer "):
+                return Response(status_code=401, content="Missing or invalid token")
+            if auth_header[7:] != auth_secret:
+                return Response(status_code=401, content="Invalid token")
+        return await call_next(request)
+
+    add_routes(app)
+    return app
+
+
+def asgi_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(AuthMiddleware, secret=SECRET, exempt_paths=("/health",))
+    app.add_middleware(TimingMiddleware)
+    app.add_middleware(RequestIdMiddleware)
+    add_routes(app)
+    return app
+
+
+async def serve(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server
+
+
+async def measure(name: str, base_url: str, total: int, concurrency: int) -> None:
+    headers = {"Authorization": f"Bearer {SECRET}"}
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits) as client:
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                (await client.get("/ping")).raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        rps = total / (time.perf_counter() - start)
+
+        ttfb = []
+        for _ in range(200):
+            start = time.perf_counter()
+            async with client.stream("GET", "/sse") as response:
+                async for _ in response.aiter_bytes():
+                    ttfb.append(time.perf_counter() - start)
+                    break
+    print(f"{name:<12} {rps:>10.0f} req/s   SSE TTFB p50 {statistics.median(ttfb) * 1000:.2f}ms"
+          f"  p99 {statistics.quantiles(ttfb, n=100)[98] * 1000:.2f}ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--access-log", action="store_true", help="Equivalente a ACCESS_LOG=1 (salida a /dev/null)")
+    args = parser.parse_args()
+    os.environ["AUTH_SECRET"] = SECRET
+    if args.access_log:
+        access_logger.setLevel(logging.INFO)
+        access_logger.addHandler(logging.StreamHandler(open(os.devnull, "w")))
+        access_logger.propagate = False
+    legacy = await serve(legacy_app(), 8701)
+    pure = await serve(asgi_app(), 8702)
+    await measure("legacy", "http://127.0.0.1:8701", args.requests, args.concurrency)
+    await measure("pure-asgi", "http://127.0.0.1:8702", args.requests, args.concurrency)
+    legacy.should_exit = pure.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""Compara /stream (un POST por turno) contra la sesión /ws para un reporte completo.
+
+Uso:
+    python benchmarks/bench_ws_vs_stream.py --url http://localhost:8080 --reports 5 --server-pid 1234
+
+Con --server-pid (Linux) se reporta además el CPU del servidor consumido por reporte.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import List, Optional
+from urllib.parse import urlencode
+from uuid import uuid4
+
+import httpx
+import websockets
+
+# Respuestas de un paciente que completan las cinco etapas del cuestionario
+REPORT_SCRIPT = [
+    "hola",
+    "me he sentido bien, con mucha alegría",
+    "sí, tomé mis medicamentos y no tuve efectos adversos",
+    "el dolor fue de 3",
+    "sí hice los ejercicios y me sentí muy bien",
+    "dormí bien, unas 8 horas",
+]
+
+
+def server_cpu_seconds(pid: Optional[int]) -> Optional[float]:
+    if pid is None:
+        return None
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime y stime son los campos 14 y 15 de /proc/<pid>/stat
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def report_over_stream(url: str, headers: dict, user_id: str) -> List[float]:
+    thread_id = str(uuid4())
+    first_byte = []
+    for message in REPORT_SCRIPT:
+        payload = {"message": message, "thread_id": thread_id, "user_id": user_id, "stream_tokens": True}
+        # Un cliente nuevo por turno, como hace hoy la app móvil
+        async with httpx.AsyncClient(timeout=120) as client:
+            start = time.perf_counter()
+            async with client.stream("POST", f"{url}/stream", json=payload, headers=headers) as response:
+                response.raise_for_status()
+                got_first = False
+                async for line in response.aiter_lines():
+                    if not got_first and line:
+                        first_byte.append(time.perf_counter() - start)
+                        got_first = True
+                    if line == "data: [DONE]":
+                        break
+    return first_byte
+
+
+async def report_over_websocket(url: str, headers: dict, user_id: str) -> List[float]:
+    thread_id = str(uuid4())
+    ws_url = url.replace("http", "ws", 1) + "/ws?" + urlencode({"thread_id": thread_id})
+    first_byte = []
+    async with websockets.connect(ws_url, extra_headers=headers) as ws:
+        for message in REPORT_SCRIPT:
+            start = time.perf_counter()
+            await ws.send(json.dumps({"message": message, "user_id": user_id, "stream_tokens": True}))
+            got_first = False
+            while True:
+                event = json.loads(await ws.recv())
+                if not got_first:
+                    first_byte.append(time.perf_counter() - start)
+                    got_first = True
+                if event["type"] == "done":
+                    break
+    return first_byte
+
+
+async def run(transport, args, headers) -> None:
+    wall, ttfb = [], []
+    cpu_start = server_cpu_seconds(args.server_pid)
+    for _ in range(args.reports):
+        start = time.perf_counter()
+        ttfb.extend(await transport(args.url, headers, args.user_id))
+        wall.append(time.perf_counter() - start)
+    cpu_end = server_cpu_seconds(args.server_pid)
+    print(f"{transport.__name__}:")
+    print(f"  wall per report     : {statistics.mean(wall):.3f}s (min {min(wall):.3f}s)")
+    print(f"  time to first event : p50 {statistics.median(ttfb) * 1000:.1f}ms  max {max(ttfb) * 1000:.1f}ms")
+    if cpu_start is not None:
+        print(f"  server CPU / report : {(cpu_end - cpu_start) / args.reports * 1000:.1f}ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--reports", type=int, default=5)
+    parser.add_argument("--user-id", default="1")
+    parser.add_argument("--server-pid", type=int, default=None)
+    args = parser.parse_args()
+    headers = {}
+    if os.getenv("AUTH_SECRET"):
+        headers["Authorization"] = f"Bearer {os.getenv('AUTH_SECRET')}"
+    await run(report_over_stream, args, headers)
+    await run(report_over_websocket, args, headers)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+CHECKPOINTER_BACKENDS = ("postgres", "sqlite", "memory")
+
+# Variables requeridas por cada backend
+REQUIRED_VARIABLES = {
+    "postgres": ["DB_HOST", "DB_NAME", "DB_PORT"],
+    "sqlite": [],
+    "memory": [],
+}
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "checkpoints.sqlite")
+
+# WAL permite lectores concurrentes con un escritor; synchronous=NORMAL es seguro
+# con WAL y evita un fsync por commit.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": "5000",
+    "temp_store": "MEMORY",
+    "cache_size": "-65536",
+    "mmap_size": "268435456",
+}
+
+
+def checkpointer_backend() -> str:
+    backend = os.getenv("CHECKPOINTER_BACKEND", "postgres").lower()
+    if backend not in CHECKPOINTER_BACKENDS:
+        raise EnvironmentError(
+            f"Invalid CHECKPOINTER_BACKEND '{backend}', expected one of: {', '.join(CHECKPOINTER_BACKENDS)}"
+        )
+    return backend
+
+
+def postgres_uri() -> str:
+    return (
+        f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:"
+        f"{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME')}?sslmode={os.getenv('DB_SSLMODE', 'require')}"
+    )
+
+
+@asynccontextmanager
+async def _postgres_checkpointer() -> AsyncIterator[BaseCheckpointSaver]:
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    from db import open_pool
+
+    # El pool (tamaño, prewarm, modo direct/transaction) se configura en db.py
+    async with open_pool(postgres_uri(), os.getenv("DB_HOST", ""), int(os.getenv("DB_PORT", "5432"))) as pool:
+        checkpointer = AsyncPostgresSaver(pool)
+        # setup() es idempotente: crea las tablas si no existen y aplica migraciones pendientes
+        await checkpointer.setup()
+        yield checkpointer
+
+
+@asynccontextmanager
+async def _sqlite_checkpointer(path: str) -> AsyncIterator[BaseCheckpointSaver]:
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    async with aiosqlite.connect(path) as conn:
+        for pragma, value in SQLITE_PRAGMAS.items():
+            await conn.execute(f"PRAGMA {pragma}={value}")
+        checkpointer = AsyncSqliteSaver(conn)
+        await checkpointer.setup()
+        yield checkpointer
+
+
+@asynccontextmanager
+async def _memory_checkpointer() -> AsyncIterator[BaseCheckpointSaver]:
+    from langgraph.checkpoint.memory import MemorySaver
+
+    yield MemorySaver()
+
+
+@asynccontextmanager
+async def open_checkpointer(backend: str, sqlite_path: str = SQLITE_PATH) -> AsyncIterator[BaseCheckpointSaver]:
+    """Abre el checkpointer del backend indicado con su configuración de conexión."""
+    if backend == "postgres":
+        async with _postgres_checkpointer() as checkpointer:
+            yield checkpointer
+    elif backend == "sqlite":
+        async with _sqlite_checkpointer(sqlite_path) as checkpointer:
+            yield checkpointer
+    elif backend == "memory":
+        async with _memory_checkpointer() as checkpointer:
+            yield checkpointer
+    else:
+        raise ValueError(f"Unknown checkpointer backend: {backend}")
+
+
+# Último checkpoint de cada thread (solo ids, vía la llave primaria) sin
+# deserializar estados; los ids de checkpoint (uuid6) ordenan por tiempo.
+LATEST_CHECKPOINTS_SQL = (
+    "SELECT thread_id, max(checkpoint_id) FROM checkpoints WHERE checkpoint_ns = '' "
+    "GROUP BY thread_id HAVING max(checkpoint_id) > {param} ORDER BY 2"
+)
+
+
+async def latest_checkpoints(
+    saver: BaseCheckpointSaver, backend: str, after: str = "", limit: Optional[int] = None
+) -> List[Tuple[str, str]]:
+    """(thread_id, checkpoint_id) del último checkpoint de cada thread más nuevo que `after`.
+
+    Ordenado del más antiguo al más nuevo, así que el último id sirve de marca
+    para la siguiente consulta incremental.
+    """
+    if backend == "postgres":
+        query = LATEST_CHECKPOINTS_SQL.format(param="%s") + (" LIMIT %s" if limit else "")
+        async with saver.conn.connection() as conn, conn.cursor() as cur:
+            await cur.execute(query, (after, limit) if limit else (after,))
+            return [tuple(row) for row in await cur.fetchall()]
+    if backend == "sqlite":
+        query = LATEST_CHECKPOINTS_SQL.format(param="?") + (" LIMIT ?" if limit else "")
+        async with saver.lock, saver.conn.execute(query, (after, limit) if limit else (after,)) as cur:
+            return [tuple(row) for row in await cur.fetchall()]
+    if backend == "memory":
+        latest = sorted(
+            (max(namespaces[""]), thread_id)
+            for thread_id, namespaces in saver.storage.items()
+            if namespaces.get("") and max(namespaces[""]) > after
+        )
+        return [(thread_id, checkpoint_id) for checkpoint_id, thread_id in latest][:limit]
+    raise ValueError(f"Unknown checkpointer backend: {backend}")
+
+
+def checkpointer_stats(backend: str) -> dict:
+    """Métricas de conexión del backend (pool de Postgres); vacío para sqlite y memory."""
+    if backend != "postgres":
+        return {}
+    from db import pool_stats
+
+    return pool_stats()
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class ThreadBusyError(Exception):
+    """Se lanza cuando un thread ya tiene un turno distinto en ejecución."""
+
+
+class TurnRun:
+    """Ejecución en curso de un turno sobre un thread.
+
+    Guarda los eventos emitidos para que cualquier cliente que se adjunte
+    (doble envío, reintento) reciba la secuencia completa desde el inicio.
+    """
+
+    def __init__(self, thread_id: str, fingerprint: str, run_id: str):
+        self.thread_id = thread_id
+        self.fingerprint = fingerprint
+        self.run_id = run_id
+        self.events: List[Dict[str, Any]] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.done = asyncio.Event()
+        self._changed = asyncio.Condition()
+        self.finished_at: Optional[float] = None
+
+    async def publish(self, event: Dict[str, Any]) -> None:
+        async with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    async def finish(self, result: Any = None, error: Optional[str] = None) -> None:
+        async with self._changed:
+            self.result = result
+            self.error = error
+            self.finished_at = time.monotonic()
+            self.done.set()
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Entrega todos los eventos del turno, incluidos los ya emitidos."""
+        index = 0
+        while True:
+            async with self._changed:
+                while index >= len(self.events) and not self.done.is_set():
+                    await self._changed.wait()
+                pending = self.events[index:]
+                finished = self.done.is_set()
+            for event in pending:
+                yield event
+            index += len(pending)
+            if finished and index >= len(self.events):
+                return
+
+    async def wait_result(self) -> Any:
+        await self.done.wait()
+        return self.result
+
+
+def turn_fingerprint(user_id: str, message: str, model: str, idempotency_key: Optional[str] = None) -> str:
+    """Identifica un envío: la llave de idempotencia si existe, o un hash del mensaje."""
+    if idempotency_key:
+        return f"key:{idempotency_key}"
+    digest = hashlib.sha256(f"{user_id}\x00{model}\x00{message}".encode("utf-8")).hexdigest()
+    return f"msg:{digest}"
+
+
+class ThreadRunRegistry:
+    """Single-flight por thread_id.
+
+    - Un envío duplicado del mismo mensaje se adjunta al turno en curso.
+    - Un mensaje distinto espera a que termine el turno en curso (busy_policy="wait")
+      o se rechaza de inmediato (busy_policy="reject").
+    - Los turnos enviados con llave de idempotencia se recuerdan durante result_ttl
+      segundos, de modo que un reintento devuelve el resultado sin volver a ejecutar.
+
+    El registro vive en memoria del proceso: con varias réplicas (Deploy/deployment.yaml
+    corre 2 detrás del balanceador) un doble envío o un reintento con la misma llave que
+    caiga en otro pod no se coalesce y vuelve a ejecutar el turno. Para que la garantía
+    valga entre réplicas el balanceador debe enrutar por thread_id (sticky routing).
+    """
+
+    def __init__(self, busy_policy: str = "wait", busy_timeout: float = 30.0, result_ttl: float = 600.0):
+        if busy_policy not in ("wait", "reject"):
+            raise ValueError(f"Invalid busy policy: {busy_policy}")
+        self.busy_policy = busy_policy
+        self.busy_timeout = busy_timeout
+        self.result_ttl = result_ttl
+        self._inflight: Dict[str, TurnRun] = {}
+        self._completed: Dict[Tuple[str, str], TurnRun] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._lock = asyncio.Lock()
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        expired = [
+            key for key, run in self._completed.items()
+            if run.finished_at is not None and now - run.finished_at > self.result_ttl
+        ]
+        for key in expired:
+            del self._completed[key]
+
+    async def submit(
+        self,
+        thread_id: str,
+        fingerprint: str,
+        run_id: str,
+        producer: Callable[[TurnRun], Awaitable[None]],
+    ) -> Tuple[TurnRun, bool]:
+        """Devuelve (run, created). created es False si se reutilizó un turno existente."""
+        deadline = time.monotonic() + self.busy_timeout
+        while True:
+            async with self._lock:
+                self._evict_expired()
+                cached = self._completed.get((thread_id, fingerprint))
+                if cached is not None:
+                    return cached, False
+                current = self._inflight.get(thread_id)
+                if current is None:
+                    run = TurnRun(thread_id, fingerprint, run_id)
+                    self._inflight[thread_id] = run
+                    # La ejecución no depende del cliente que la inició: si se
+                    # desconecta, los clientes adjuntos siguen recibiendo eventos.
+                    self._tasks[thread_id] = asyncio.create_task(self._execute(run, producer))
+                    return run, True
+                if current.fingerprint == fingerprint:
+                    return current, False
+                if self.busy_policy == "reject":
+                    raise ThreadBusyError(f"Thread {thread_id} is already processing another message")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ThreadBusyError(f"Timed out waiting for thread {thread_id} to finish the current turn")
+            try:
+                await asyncio.wait_for(current.done.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                raise ThreadBusyError(f"Timed out waiting for thread {thread_id} to finish the current turn")
+
+    async def _execute(self, run: TurnRun, producer: Callable[[TurnRun], Awaitable[None]]) -> None:
+        try:
+            await producer(run)
+        except Exception as e:
+            await run.finish(error=str(e))
+        finally:
+            if not run.done.is_set():
+                await run.finish(error="Run finished without a result")
+            async with self._lock:
+                if self._inflight.get(run.thread_id) is run:
+                    del self._inflight[run.thread_id]
+                    self._tasks.pop(run.thread_id, None)
+                if run.fingerprint.startswith("key:") and run.error is None:
+                    self._completed[(run.thread_id, run.fingerprint)] = run
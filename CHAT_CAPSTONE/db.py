@@ -0,0 +1,183 @@
+import asyncio
+import os
+import re
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from psycopg import AsyncCursor
+from psycopg_pool import AsyncConnectionPool
+
+# Tamaño del pool: min_size conexiones quedan abiertas (y se abren antes de
+# servir tráfico); DB_MAX_CONNECTIONS se mantiene como alias del máximo.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "4"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", os.getenv("DB_MAX_CONNECTIONS", "20")))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_OPEN_TIMEOUT = float(os.getenv("DB_POOL_OPEN_TIMEOUT", "30"))
+# Reciclado: conexiones ociosas o viejas se cierran y reemplazan en segundo plano
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+# Cada cuántos segundos se validan las conexiones ociosas con pool.check() (0 lo desactiva).
+# Validarlas al sacarlas del pool costaría un round trip extra en cada request.
+DB_POOL_CHECK_INTERVAL = float(os.getenv("DB_POOL_CHECK_INTERVAL", "60"))
+
+# "direct": Postgres o pgbouncer en modo session, los prepared statements sobreviven
+# en la conexión. "transaction": pooler en modo transaction (pgbouncer, Supabase,
+# Neon), cada transacción puede caer en otro backend y no hay que preparar nada.
+# "auto" decide por host/puerto.
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "auto").lower()
+DB_POOL_MODES = ("auto", "direct", "transaction")
+TRANSACTION_POOLER_PORTS = {6432}
+# En psycopg prepare_threshold=0 prepara cada query en su primera ejecución y None
+# desactiva los prepared statements. Las queries del checkpointer son siempre las
+# mismas, así que en modo direct conviene prepararlas desde el inicio.
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "0"))
+
+_STATEMENT_VERB = re.compile(r"^\s*(\w+)")
+# En un SELECT con subconsultas la tabla principal es el último FROM (las
+# funciones como jsonb_each_text(...) no cuentan como tabla)
+_STATEMENT_TABLE = re.compile(r"\b(?:from|into|update)\s+(\w+)\b(?!\()", re.I)
+
+_pool: Optional[AsyncConnectionPool] = None
+_pool_mode: Optional[str] = None
+statement_stats: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+
+
+def pool_mode(host: str, port: int, configured: str = DB_POOL_MODE) -> str:
+    """Modo del pool: el configurado, o inferido si está en "auto"."""
+    if configured not in DB_POOL_MODES:
+        raise EnvironmentError(f"Invalid DB_POOL_MODE '{configured}', expected one of: {', '.join(DB_POOL_MODES)}")
+    if configured != "auto":
+        return configured
+    if port in TRANSACTION_POOLER_PORTS or "pooler" in host.lower():
+        return "transaction"
+    return "direct"
+
+
+def connection_kwargs(mode: str) -> Dict[str, Any]:
+    return {
+        "autocommit": True,
+        "prepare_threshold": DB_PREPARE_THRESHOLD if mode == "direct" else None,
+        "cursor_factory": TimedCursor,
+    }
+
+
+def statement_key(query: Any) -> str:
+    if not isinstance(query, str):
+        return type(query).__name__
+    verb = _STATEMENT_VERB.match(query)
+    tables = _STATEMENT_TABLE.findall(query)
+    if not verb:
+        return "unknown"
+    if not tables:
+        return verb.group(1).lower()
+    table = tables[-1] if verb.group(1).lower() == "select" else tables[0]
+    return f"{verb.group(1).lower()} {table.lower()}"
+
+
+def record_statement(query: Any, elapsed: float) -> None:
+    if isinstance(query, str) and not query.strip():
+        # Query vacía de AsyncConnectionPool.check_connection: no es tráfico del checkpointer
+        return
+    stats = statement_stats[statement_key(query)]
+    elapsed_ms = elapsed * 1000
+    stats["count"] += 1
+    stats["total_ms"] += elapsed_ms
+    stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+
+class TimedCursor(AsyncCursor):
+    """Cursor que acumula la latencia de cada statement por tipo ("select checkpoints", ...).
+
+    En modo pipeline el tiempo medido es el del envío, no el de la respuesta.
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            record_statement(query, time.perf_counter() - start)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            record_statement(query, time.perf_counter() - start)
+
+
+@asynccontextmanager
+async def open_pool(conninfo: str, host: str, port: int) -> AsyncIterator[AsyncConnectionPool]:
+    """Abre el pool y espera a tener min_size conexiones listas antes de devolverlo."""
+    global _pool, _pool_mode
+    mode = pool_mode(host, port)
+    pool = AsyncConnectionPool(
+        conninfo=conninfo,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=max(DB_POOL_MAX_SIZE, DB_POOL_MIN_SIZE),
+        kwargs=connection_kwargs(mode),
+        timeout=DB_POOL_TIMEOUT,
+        max_idle=DB_POOL_MAX_IDLE,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        name="checkpoints",
+        open=False,
+    )
+    start = time.perf_counter()
+    try:
+        await pool.open(wait=True, timeout=DB_POOL_OPEN_TIMEOUT)
+    except BaseException:
+        await pool.close()
+        raise
+    print(f"DB pool ({mode}) prewarmed with {DB_POOL_MIN_SIZE} connections in {time.perf_counter() - start:.2f}s")
+    _pool, _pool_mode = pool, mode
+    checker = asyncio.create_task(check_pool_periodically(pool)) if DB_POOL_CHECK_INTERVAL > 0 else None
+    try:
+        yield pool
+    finally:
+        if checker is not None:
+            checker.cancel()
+        _pool, _pool_mode = None, None
+        await pool.close()
+
+
+async def check_pool_periodically(pool: AsyncConnectionPool, interval: float = DB_POOL_CHECK_INTERVAL) -> None:
+    """Descarta en segundo plano las conexiones ociosas cortadas por el servidor o un balanceador."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await pool.check()
+        except Exception as e:
+            print(f"DB pool check failed: {e!r}")
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Estado del pool abierto, tiempo de espera por conexión y latencia por statement."""
+    if _pool is None:
+        return {}
+    stats = _pool.get_stats()
+    requests = stats.get("requests_num", 0)
+    return {
+        "mode": _pool_mode,
+        "prepare_threshold": _pool.kwargs.get("prepare_threshold"),
+        "size": stats.get("pool_size", 0),
+        "available": stats.get("pool_available", 0),
+        "min_size": stats.get("pool_min", 0),
+        "max_size": stats.get("pool_max", 0),
+        "requests": requests,
+        "requests_queued": stats.get("requests_queued", 0),
+        "requests_waiting": stats.get("requests_waiting", 0),
+        "requests_errors": stats.get("requests_errors", 0),
+        "mean_wait_ms": stats.get("requests_wait_ms", 0) / requests if requests else 0.0,
+        "connections_lost": stats.get("connections_lost", 0),
+        "returns_bad": stats.get("returns_bad", 0),
+        "statements": {
+            key: {
+                "count": int(values["count"]),
+                "mean_ms": round(values["total_ms"] / values["count"], 3),
+                "max_ms": round(values["max_ms"], 3),
+            }
+            for key, values in statement_stats.items()
+        },
+    }
@@ -0,0 +1,197 @@
+import asyncio
+import copy
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+
+
+class CheckpointPersistError(Exception):
+    """Una escritura en segundo plano al checkpointer durable falló."""
+
+
+class HotCheckpointer(BaseCheckpointSaver):
+    """Checkpointer write-behind sobre un checkpointer durable.
+
+    Los threads "fijados" (pin) mantienen su último checkpoint en memoria: las
+    lecturas no tocan la base de datos y las escrituras se persisten en segundo
+    plano, en orden, por un worker por thread. Los threads no fijados pasan
+    directo al checkpointer durable, así que el mismo grafo compilado sirve
+    para HTTP y para sesiones WebSocket.
+
+    Quien fija un thread debe llamar flush() al cerrar cada turno (la sesión
+    WebSocket lo hace antes de enviar "done"): así la base queda al día en cada
+    frontera de turno y los errores de persistencia llegan como
+    CheckpointPersistError en vez de perderse. La copia en memoria no ve
+    escrituras de otros procesos, de modo que mientras un thread está fijado sus
+    turnos deben llegar a esta réplica (sticky routing por thread_id, igual que
+    el coalescing de ThreadRunRegistry).
+    """
+
+    def __init__(self, durable: BaseCheckpointSaver):
+        super().__init__(serde=durable.serde)
+        self.durable = durable
+        self._latest: Dict[Tuple[str, str], CheckpointTuple] = {}
+        self._pins: Dict[str, int] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._failures: Dict[str, Exception] = {}
+
+    @staticmethod
+    def _thread(config: RunnableConfig) -> Tuple[str, str, Optional[str]]:
+        configurable = config["configurable"]
+        return (
+            str(configurable["thread_id"]),
+            configurable.get("checkpoint_ns", ""),
+            configurable.get("checkpoint_id"),
+        )
+
+    def pin(self, thread_id: str) -> None:
+        """Mantiene el estado del thread en memoria hasta el release correspondiente."""
+        self._pins[thread_id] = self._pins.get(thread_id, 0) + 1
+        if thread_id not in self._workers:
+            queue: asyncio.Queue = asyncio.Queue()
+            self._queues[thread_id] = queue
+            self._workers[thread_id] = asyncio.create_task(self._persist(thread_id, queue))
+
+    async def release(self, thread_id: str) -> None:
+        """Suelta un pin; con el último se esperan las escrituras pendientes y se libera la memoria."""
+        count = self._pins.get(thread_id, 0) - 1
+        if count > 0:
+            self._pins[thread_id] = count
+            return
+        # El contador queda en 0 (no se borra) mientras se vacía la cola: un pin()
+        # de otra sesión durante el flush lo vuelve a subir y conserva worker y cache.
+        self._pins[thread_id] = 0
+        try:
+            await self.flush(thread_id)
+        finally:
+            # Tras el último join no hay await antes de soltar el pin, así que ninguna
+            # escritura nueva puede adelantarse a las que quedaban en cola.
+            if self._pins.get(thread_id) == 0:
+                self._evict(thread_id)
+
+    def _evict(self, thread_id: str) -> None:
+        self._pins.pop(thread_id, None)
+        worker = self._workers.pop(thread_id, None)
+        self._queues.pop(thread_id, None)
+        self._failures.pop(thread_id, None)
+        if worker is not None:
+            worker.cancel()
+        for key in [key for key in self._latest if key[0] == thread_id]:
+            del self._latest[key]
+
+    async def flush(self, thread_id: str) -> None:
+        """Espera las escrituras en cola del thread; lanza CheckpointPersistError si alguna falló."""
+        queue = self._queues.get(thread_id)
+        if queue is not None:
+            await queue.join()
+        error = self._failures.pop(thread_id, None)
+        if error is not None:
+            raise CheckpointPersistError(f"Error persisting checkpoint for thread {thread_id}: {error}") from error
+
+    async def _persist(self, thread_id: str, queue: asyncio.Queue) -> None:
+        while True:
+            method, args = await queue.get()
+            try:
+                await getattr(self.durable, method)(*args)
+            except Exception as e:
+                # Se informa en el próximo flush(); se guarda el primer error del turno
+                print(f"Error persisting checkpoint for thread {thread_id}: {e}", flush=True)
+                self._failures.setdefault(thread_id, e)
+            finally:
+                queue.task_done()
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id, checkpoint_ns, checkpoint_id = self._thread(config)
+        if thread_id not in self._pins:
+            return await self.durable.aget_tuple(config)
+        cached = self._latest.get((thread_id, checkpoint_ns))
+        if cached is not None and checkpoint_id in (None, cached.checkpoint["id"]):
+            return copy.deepcopy(cached)
+        await self.flush(thread_id)
+        loaded = await self.durable.aget_tuple(config)
+        if loaded is not None and checkpoint_id is None:
+            self._latest[(thread_id, checkpoint_ns)] = copy.deepcopy(loaded)
+        return loaded
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is not None:
+            await self.flush(self._thread(config)[0])
+        async for item in self.durable.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id, checkpoint_ns, _ = self._thread(config)
+        if thread_id not in self._pins:
+            return await self.durable.aput(config, checkpoint, metadata, new_versions)
+        # Los nodos mutan el estado en sitio (p.ej. slots.update), así que la copia
+        # en memoria y la que se persiste no pueden compartir objetos con el grafo.
+        checkpoint = copy.deepcopy(checkpoint)
+        metadata = copy.deepcopy(metadata)
+        next_config = {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+        # El config que entrega el grafo trae callbacks y otros objetos no copiables,
+        # así que el parent_config en memoria guarda solo las llaves del checkpoint.
+        parent_config = None
+        if config["configurable"].get("checkpoint_id"):
+            parent_config = {
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": config["configurable"]["checkpoint_id"],
+                }
+            }
+        self._latest[(thread_id, checkpoint_ns)] = CheckpointTuple(
+            config=next_config,
+            checkpoint=checkpoint,
+            metadata=metadata,
+            parent_config=parent_config,
+            pending_writes=[],
+        )
+        self._queues[thread_id].put_nowait(("aput", (config, checkpoint, metadata, dict(new_versions))))
+        return next_config
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+    ) -> None:
+        thread_id, checkpoint_ns, checkpoint_id = self._thread(config)
+        if thread_id not in self._pins:
+            return await self.durable.aput_writes(config, writes, task_id)
+        writes = copy.deepcopy(list(writes))
+        cached = self._latest.get((thread_id, checkpoint_ns))
+        if cached is not None and cached.checkpoint["id"] == checkpoint_id:
+            pending = list(cached.pending_writes or [])
+            pending.extend((task_id, channel, value) for channel, value in writes)
+            self._latest[(thread_id, checkpoint_ns)] = cached._replace(pending_writes=pending)
+        self._queues[thread_id].put_nowait(("aput_writes", (config, writes, task_id)))
+
+    def get_next_version(self, current: Optional[Any], channel: Any) -> Any:
+        return self.durable.get_next_version(current, channel)
@@ -0,0 +1,146 @@
+import hmac
+import logging
+import time
+from typing import Iterable, Optional
+from uuid import uuid4
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+access_logger = logging.getLogger("health_assistant.access")
+# Subprotocolo que antecede al token en Sec-WebSocket-Protocol
+WS_AUTH_PROTOCOL = "bearer"
+
+
+def _header(scope: Scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value
+    return None
+
+
+def _accept_auth_protocol(send: Send) -> Send:
+    # El cliente ofreció subprotocolos: el navegador corta la conexión si el
+    # servidor no elige uno, así que se responde "bearer" (nunca el token)
+    async def send_with_protocol(message: Message) -> None:
+        if message["type"] == "websocket.accept" and not message.get("subprotocol"):
+            message = {**message, "subprotocol": WS_AUTH_PROTOCOL}
+        await send(message)
+
+    return send_with_protocol
+
+
+class AuthMiddleware:
+    """Autenticación Bearer como middleware ASGI puro (HTTP y WebSocket).
+
+    El secreto se lee una sola vez al construir la app y se compara en tiempo
+    constante. Los navegadores no permiten headers en el handshake de un WebSocket,
+    así que ahí el token también se acepta como subprotocolo:
+    `Sec-WebSocket-Protocol: bearer, <token>`. Nunca en la query string, que
+    uvicorn y los proxies registran en el access log.
+    """
+
+    def __init__(self, app: ASGIApp, secret: Optional[str], exempt_paths: Iterable[str] = ("/health",)):
+        self.app = app
+        self.secret = secret.encode() if secret else None
+        self.exempt_paths = frozenset(exempt_paths)
+
+    def _token(self, scope: Scope) -> Optional[bytes]:
+        auth_header = _header(scope, b"authorization")
+        if auth_header is not None:
+            return auth_header[7:] if auth_header.startswith(b"Bearer ") else None
+        if scope["type"] == "websocket":
+            protocols = scope.get("subprotocols", [])
+            if len(protocols) >= 2 and protocols[0] == WS_AUTH_PROTOCOL:
+                return protocols[1].encode()
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            self.secret is None
+            or scope["type"] not in ("http", "websocket")
+            or scope["path"] in self.exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+        token = self._token(scope)
+        if token is not None and hmac.compare_digest(token, self.secret):
+            if scope["type"] == "websocket" and _header(scope, b"authorization") is None:
+                send = _accept_auth_protocol(send)
+            await self.app(scope, receive, send)
+            return
+        if scope["type"] == "websocket":
+            # Cerrar antes del accept hace que el servidor responda 403 al handshake
+            await send({"type": "websocket.close", "code": 1008, "reason": "Invalid token"})
+            return
+        body = b"Missing or invalid token" if token is None else b"Invalid token"
+        await send({
+            "type": "http.response.start",
+            "status": 401,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class RequestIdMiddleware:
+    """Propaga X-Request-ID (o genera uno) en scope["state"] y en la respuesta."""
+
+    def __init__(self, app: ASGIApp, header_name: str = "x-request-id"):
+        self.app = app
+        self.header_name = header_name.encode()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        incoming = _header(scope, self.header_name)
+        request_id = incoming.decode("latin-1") if incoming else uuid4().hex
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (self.header_name, request_id.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
+
+
+class TimingMiddleware:
+    """Agrega Server-Timing con el tiempo hasta los headers y registra la duración total.
+
+    En respuestas SSE el tiempo hasta los headers es el time-to-first-byte del stream.
+    El registro va al logger "health_assistant.access" en nivel INFO (si no está
+    habilitado no se formatea nada) y omite exempt_paths, p.ej. los probes de /health.
+    """
+
+    def __init__(self, app: ASGIApp, log: bool = True, exempt_paths: Iterable[str] = ("/health",)):
+        self.app = app
+        self.log = log
+        self.exempt_paths = frozenset(exempt_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                duration_ms = (time.perf_counter() - start) * 1000
+                message["headers"] = [*message.get("headers", []), (b"server-timing", f"app;dur={duration_ms:.1f}".encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if self.log and scope["path"] not in self.exempt_paths and access_logger.isEnabledFor(logging.INFO):
+                access_logger.info(
+                    "%s %s %s %.1fms request_id=%s",
+                    scope["method"],
+                    scope["path"],
+                    status,
+                    (time.perf_counter() - start) * 1000,
+                    scope.get("state", {}).get("request_id", "-"),
+                )
@@ -0,0 +1,162 @@
+import difflib
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Literal, NamedTuple, get_args, get_origin
+
+from pydantic import ValidationError
+
+from schemas import (
+    AtributosPacientes,
+    parse_dolor,
+    parse_ejercicio,
+    parse_estado_general,
+    parse_medicamentos,
+    parse_sueno,
+)
+
+# Schema y etapa de cada herramienta que llena slots
+SLOT_SCHEMAS = {
+    "parse_estado_general": parse_estado_general,
+    "parse_medicamentos": parse_medicamentos,
+    "parse_dolor": parse_dolor,
+    "parse_ejercicio": parse_ejercicio,
+    "parse_sueno": parse_sueno,
+    "save_patient_report": AtributosPacientes,
+}
+STAGE_BY_TOOL = {
+    "parse_estado_general": "emotions",
+    "parse_medicamentos": "medications",
+    "parse_dolor": "pain",
+    "parse_ejercicio": "exercise",
+    "parse_sueno": "sleep",
+    "save_patient_report": "sleep",
+}
+
+# Sinónimos frecuentes, ya en forma plana (minúsculas, sin tildes)
+SYNONYMS = {
+    "si": ["yes", "true", "claro", "afirmativo", "tome", "lo hice"],
+    "no": ["false", "nop", "negativo", "ninguno", "ninguna"],
+    # "ninguno"/"ninguna" van solo en "no": cada sinónimo debe tener un único canónico
+    "no aplica": ["na", "n/a", "nada", "no corresponde"],
+    "bien": ["bueno", "buena"],
+    "mal": ["malo", "mala"],
+    "muy bien": ["muy bueno", "muy buena", "excelente"],
+    "muy mal": ["muy malo", "muy mala", "pesimo", "pesima", "terrible"],
+    "buena": ["bien", "bueno"],
+    "mala": ["mal", "malo"],
+    "muy buena": ["muy bien", "muy bueno"],
+    "muy mala": ["muy mal", "muy malo", "pesima", "pesimo"],
+    "alegria": ["feliz", "contento", "contenta", "felicidad"],
+    "tristeza": ["triste", "pena"],
+    "miedo": ["temor", "susto", "asustado", "asustada"],
+    "rabia": ["enojo", "ira", "enojado", "enojada", "molesto", "molesta"],
+    "frustracion": ["frustrado", "frustrada"],
+}
+NUMBER_WORDS = {
+    "uno": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5, "seis": 6,
+    "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11, "doce": 12,
+}
+NUMERIC_FIELDS = {"horas_sueño": (1, 24)}
+
+
+class NormalizationResult(NamedTuple):
+    slots: Dict[str, Any]
+    repaired: List[str]
+    errors: List[str]
+
+
+# Conteo por etapa de extracciones limpias, reparadas localmente y re-preguntadas
+extraction_stats: Counter = Counter()
+
+
+def record_extraction(tool_name: str, outcome: str) -> None:
+    extraction_stats[(STAGE_BY_TOOL.get(tool_name, tool_name), outcome)] += 1
+
+
+def extraction_stats_snapshot() -> Dict[str, Dict[str, int]]:
+    snapshot: Dict[str, Dict[str, int]] = {}
+    for (stage, outcome), count in extraction_stats.items():
+        snapshot.setdefault(stage, {"clean": 0, "repaired": 0, "reasked": 0})[outcome] = count
+    return snapshot
+
+
+def _ascii(value: Any) -> str:
+    return unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode().lower()
+
+
+def _plain(value: Any) -> str:
+    return " ".join(re.sub(r"[^\w\s/]", " ", _ascii(value)).split())
+
+
+def _number(value: Any):
+    match = re.search(r"\d+(?:[.,]\d+)?", _ascii(value))
+    if match:
+        number = float(match.group().replace(",", "."))
+    else:
+        words = [NUMBER_WORDS[w] for w in _plain(value).split() if w in NUMBER_WORDS]
+        if not words:
+            return None
+        number = float(words[0])
+    return int(number) if number.is_integer() else number
+
+
+def _match_choice(value: Any, choices: List[str]):
+    """Busca el valor permitido que corresponde a `value`, o None."""
+    plain_choices = {_plain(choice): choice for choice in choices}
+    plain = _plain(value)
+    if plain in plain_choices:
+        return plain_choices[plain]
+    if all(choice.isdigit() for choice in choices):
+        # Escalas numéricas: "7/10", "un 7", "siete"
+        number = _number(value)
+        if number is not None and str(number) in choices:
+            return str(number)
+        return None
+    for canonical, synonyms in SYNONYMS.items():
+        if canonical in plain_choices and plain in synonyms:
+            return plain_choices[canonical]
+    close = difflib.get_close_matches(plain, list(plain_choices), n=1, cutoff=0.85)
+    return plain_choices[close[0]] if close else None
+
+
+def normalize_slots(tool_name: str, args: Dict[str, Any]) -> NormalizationResult:
+    """Normaliza y valida los argumentos de una herramienta de slots sin llamar al LLM.
+
+    Los valores que no calzan exacto con los permitidos se reparan (tildes, typos,
+    sinónimos, "7/10"); los que no se pueden reparar se devuelven en errors.
+    """
+    schema = SLOT_SCHEMAS.get(tool_name)
+    if schema is None:
+        return NormalizationResult(dict(args), [], [])
+    slots, repaired, errors = dict(args), [], []
+    for name, field in schema.model_fields.items():
+        if name not in slots:
+            continue
+        value = slots[name]
+        if get_origin(field.annotation) is Literal:
+            choices = list(get_args(field.annotation))
+            if value in choices:
+                continue
+            match = _match_choice(value, choices)
+            if match is None:
+                errors.append(f"{name}: '{value}' no es válido, valores posibles: {', '.join(choices)}")
+            else:
+                slots[name] = match
+                repaired.append(name)
+        elif name in NUMERIC_FIELDS:
+            low, high = NUMERIC_FIELDS[name]
+            number = _number(value)
+            if number is None or not low <= number <= high:
+                errors.append(f"{name}: '{value}' no es válido, debe ser un número de {low} a {high}")
+            elif str(number) != str(value):
+                slots[name] = str(number)
+                repaired.append(name)
+        elif isinstance(value, str) and value != value.strip():
+            slots[name] = value.strip()
+    if not errors:
+        try:
+            schema.model_validate(slots)
+        except ValidationError as e:
+            errors.extend(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+    return NormalizationResult(slots, repaired, errors)
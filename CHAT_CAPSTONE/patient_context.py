@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from tools import get_patient_last_report
+
+# Con 0 la etapa de emociones vuelve a pedirle al modelo que llame verify_selfreport
+PREFETCH_PATIENT_CONTEXT = os.getenv("PREFETCH_PATIENT_CONTEXT", "1") == "1"
+# Segundos que se guarda un contexto precargado que ningún turno consumió
+PATIENT_CONTEXT_TTL = float(os.getenv("PATIENT_CONTEXT_TTL", "60"))
+# Threads recordados como ya vistos (los más antiguos se olvidan primero)
+PATIENT_CONTEXT_MAX_SEEN = int(os.getenv("PATIENT_CONTEXT_MAX_SEEN", "10000"))
+
+VERIFY_TOOL = get_patient_last_report.name
+VERIFY_MESSAGE = "Genial, primero verificaré que no hayas respondido tu autoreporte hoy"
+
+
+async def fetch_patient_context(user_id: str) -> str:
+    """Último reporte del paciente / si ya respondió hoy (lo mismo que devuelve verify_selfreport)."""
+    return str(await get_patient_last_report.ainvoke({"user_id": user_id}))
+
+
+def is_verified(messages: List[BaseMessage]) -> bool:
+    return any(isinstance(m, ToolMessage) and m.name == VERIFY_TOOL for m in messages)
+
+
+def verify_messages(report: str, user_id: str, call_id: str) -> List[BaseMessage]:
+    """Par llamada/resultado de verify_selfreport, como si el modelo la hubiera pedido."""
+    args = {"user_id": int(user_id) if str(user_id).isdigit() else user_id}
+    call = AIMessage(
+        content=VERIFY_MESSAGE,
+        additional_kwargs={"tool_calls": [{
+            "id": call_id,
+            "type": "function",
+            "function": {"name": VERIFY_TOOL, "arguments": json.dumps(args)},
+        }]},
+        tool_calls=[{"name": VERIFY_TOOL, "args": args, "id": call_id}],
+    )
+    return [call, ToolMessage(content=report, name=VERIFY_TOOL, tool_call_id=call_id)]
+
+
+class PatientContextPrefetcher:
+    """Consulta el contexto del paciente apenas llega el request, en paralelo al arranque del grafo.
+
+    Solo se lanza para threads que el proceso no ha visto (sin leer el checkpoint):
+    un thread que se retoma en otro proceso paga a lo más una consulta sin usar,
+    que se descarta al vencer el TTL. La etapa de emociones lo consume con take();
+    si no hubo prefetch (replay, tests) la consulta se hace en ese momento, igual
+    sin una llamada extra al modelo.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[str]] = fetch_patient_context,
+        ttl: float = PATIENT_CONTEXT_TTL,
+        max_seen: int = PATIENT_CONTEXT_MAX_SEEN,
+    ):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_seen = max_seen
+        self._tasks: Dict[str, Tuple[asyncio.Task, float]] = {}
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for thread_id, (task, started) in list(self._tasks.items()):
+            if now - started > self.ttl:
+                task.cancel()
+                del self._tasks[thread_id]
+                self.expired += 1
+
+    def start(self, thread_id: str, user_id: str) -> Optional[asyncio.Task]:
+        """Lanza la consulta si el thread es nuevo para este proceso; devuelve la tarea creada o None."""
+        self._purge()
+        if thread_id in self._seen or thread_id in self._tasks:
+            return None
+        self._seen[thread_id] = None
+        if len(self._seen) > self.max_seen:
+            self._seen.popitem(last=False)
+        task = asyncio.create_task(self.fetch(user_id))
+        self._tasks[thread_id] = (task, time.monotonic())
+        return task
+
+    def discard(self, thread_id: str, task: asyncio.Task) -> None:
+        """Cancela la consulta `task` del thread, solo si sigue siendo la registrada."""
+        entry = self._tasks.get(thread_id)
+        if entry is not None and entry[0] is task:
+            del self._tasks[thread_id]
+            task.cancel()
+            self._seen.pop(thread_id, None)
+
+    async def take(self, thread_id: Optional[str], user_id: str) -> str:
+        entry = self._tasks.pop(thread_id, None) if thread_id else None
+        if entry is not None:
+            try:
+                report = await entry[0]
+                self.hits += 1
+                return report
+            except Exception as e:
+                print(f"Prefetch de contexto falló para {thread_id}: {e!r}")
+        self.misses += 1
+        return await self.fetch(user_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "expired": self.expired, "pending": len(self._tasks)}
+
+
+patient_context = PatientContextPrefetcher()
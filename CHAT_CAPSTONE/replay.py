@@ -0,0 +1,244 @@
+"""Replay offline de threads grabados para detectar regresiones de latencia y llamadas al LLM.
+
+Toma los mensajes humanos de cada thread (desde las tablas de checkpoints o desde
+un JSONL exportado), los vuelve a pasar por el grafo en paralelo contra un LLM
+local y reporta por thread: turnos hasta completar el reporte, llamadas al LLM,
+tokens de prompt y tiempo total. Puede comparar contra un baseline guardado y
+terminar con código 1 si hay regresiones sobre el umbral.
+
+Ejemplos:
+    # Exportar threads reales a JSONL
+    python replay.py --source checkpoints --backend postgres --limit 200 --export threads.jsonl
+    # Guardar un baseline con el LLM fake
+    python replay.py --input threads.jsonl --save-baseline baseline.json
+    # Verificar un cambio de grafo/prompt contra el baseline
+    python replay.py --input threads.jsonl --baseline baseline.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, convert_to_messages
+from langchain_core.runnables import RunnableConfig
+
+from replay_llm import FakeQuestionaryChatModel, LLMUsageCallback, RecordedChatModel, ResponseStore
+from utils import set_llm_factory
+
+COMPLETED_STAGE = 6
+METRICS = ("turns_to_completion", "llm_calls", "prompt_tokens", "wall_time_s")
+
+
+def load_jsonl(path: str, limit: Optional[int]) -> List[Dict[str, Any]]:
+    """Formato: {"thread_id": "...", "user_id": "...", "messages": ["...", ...]} por línea."""
+    threads = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                threads.append(json.loads(line))
+            if limit and len(threads) >= limit:
+                break
+    return threads
+
+
+async def thread_inputs(saver, thread_id: str) -> Optional[Dict[str, Any]]:
+    """Mensajes del paciente de un thread, rearmados turno a turno desde los checkpoints de input.
+
+    No se leen del channel_values del último checkpoint: en los threads del grafo
+    original los nodos devolvían el historial completo a un reducer operator.add,
+    así que ahí cada HumanMessage aparece repetido.
+    """
+    turns = []
+    user_id = None
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    # alist devuelve del más nuevo al más antiguo; el filtro evita cargar los checkpoints del loop
+    async for checkpoint_tuple in saver.alist(config, filter={"source": "input"}):
+        start = (checkpoint_tuple.metadata.get("writes") or {}).get("__start__") or {}
+        turns.append([
+            m.content for m in convert_to_messages(start.get("messages", [])) if isinstance(m, HumanMessage)
+        ])
+        user_id = user_id or start.get("user_id")
+    messages = [message for turn in reversed(turns) for message in turn]
+    if not messages:
+        return None
+    return {"thread_id": thread_id, "user_id": str(user_id or "1"), "messages": messages}
+
+
+async def load_saved_threads(saver, backend: str, limit: Optional[int]) -> List[Dict[str, Any]]:
+    from checkpointers import latest_checkpoints
+
+    threads = []
+    # Solo los ids de thread (acotados por --limit); los mensajes se leen por thread
+    for thread_id, _ in await latest_checkpoints(saver, backend, limit=limit):
+        thread = await thread_inputs(saver, thread_id)
+        if thread is not None:
+            threads.append(thread)
+    return threads
+
+
+async def load_checkpoints(backend: str, limit: Optional[int]) -> List[Dict[str, Any]]:
+    from checkpointers import open_checkpointer
+
+    async with open_checkpointer(backend) as saver:
+        return await load_saved_threads(saver, backend, limit)
+
+
+async def replay_thread(graph, thread: Dict[str, Any], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    async with semaphore:
+        usage = LLMUsageCallback()
+        config = RunnableConfig(configurable={"thread_id": str(uuid4())}, callbacks=[usage])
+        turns_to_completion = None
+        error = None
+        start = time.perf_counter()
+        try:
+            for turn, message in enumerate(thread["messages"], start=1):
+                state = await graph.ainvoke(
+                    {"messages": [HumanMessage(content=message)], "user_id": thread["user_id"]}, config
+                )
+                if int(state.get("stage", 1)) >= COMPLETED_STAGE:
+                    turns_to_completion = turn
+                    break
+        except Exception as e:
+            error = str(e)
+        return {
+            "thread_id": thread["thread_id"],
+            "completed": turns_to_completion is not None,
+            "turns_to_completion": turns_to_completion or len(thread["messages"]),
+            "llm_calls": usage.calls,
+            "prompt_tokens": usage.prompt_tokens,
+            "wall_time_s": round(time.perf_counter() - start, 4),
+            "error": error,
+        }
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = {"threads": len(results), "completed": sum(r["completed"] for r in results)}
+    for metric in METRICS:
+        values = [r[metric] for r in results]
+        summary[metric] = {"mean": statistics.mean(values), "total": sum(values)} if values else {}
+    return summary
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float, time_threshold: float) -> List[str]:
+    """Devuelve la lista de regresiones respecto del baseline."""
+    regressions = []
+    previous = {r["thread_id"]: r for r in baseline["threads"]}
+    for result in report["threads"]:
+        base = previous.get(result["thread_id"])
+        if base is None:
+            continue
+        if base["completed"] and not result["completed"]:
+            regressions.append(f"{result['thread_id']}: no longer completes the report")
+        for metric in METRICS:
+            limit = time_threshold if metric == "wall_time_s" else threshold
+            if base[metric] and result[metric] > base[metric] * (1 + limit):
+                regressions.append(
+                    f"{result['thread_id']}: {metric} {base[metric]} -> {result[metric]} (+{limit:.0%} allowed)"
+                )
+    for metric in METRICS:
+        limit = time_threshold if metric == "wall_time_s" else threshold
+        base_mean = baseline["summary"][metric].get("mean")
+        mean = report["summary"][metric].get("mean")
+        if base_mean and mean is not None and mean > base_mean * (1 + limit):
+            regressions.append(f"summary: mean {metric} {base_mean:.3f} -> {mean:.3f} (+{limit:.0%} allowed)")
+    return regressions
+
+
+async def main() -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", choices=["jsonl", "checkpoints"], default="jsonl")
+    parser.add_argument("--input", help="JSONL de threads cuando --source jsonl")
+    parser.add_argument("--backend", choices=["postgres", "sqlite"], default="postgres",
+                        help="Backend de checkpoints cuando --source checkpoints")
+    parser.add_argument("--export", help="Escribe los threads cargados a este JSONL y termina")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm", choices=["fake", "recorded", "record"], default="fake",
+                        help="fake: LLM local; recorded: respuestas grabadas; record: graba usando el modelo real")
+    parser.add_argument("--store", default="recorded_responses.jsonl")
+    parser.add_argument("--output", help="Escribe el reporte completo en JSON")
+    parser.add_argument("--baseline", help="Baseline contra el cual comparar")
+    parser.add_argument("--save-baseline", help="Guarda este reporte como baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Regresión permitida en turnos/llamadas/tokens")
+    parser.add_argument("--time-threshold", type=float, default=0.5, help="Regresión permitida en tiempo")
+    args = parser.parse_args()
+
+    if args.source == "jsonl":
+        if not args.input:
+            parser.error("--input is required with --source jsonl")
+        threads = load_jsonl(args.input, args.limit)
+    else:
+        threads = await load_checkpoints(args.backend, args.limit)
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as f:
+            for thread in threads:
+                f.write(json.dumps(thread, ensure_ascii=False) + "\n")
+        print(f"Exported {len(threads)} threads to {args.export}")
+        return 0
+
+    models = []
+    if args.llm == "fake":
+        set_llm_factory(FakeQuestionaryChatModel)
+    else:
+        store = ResponseStore(args.store)
+
+        def recorded_factory():
+            inner = None
+            if args.llm == "record":
+                from langchain_openai import ChatOpenAI
+                inner = ChatOpenAI(model="gpt-4o", temperature=0, max_retries=2)
+            model = RecordedChatModel(store=store, inner=inner)
+            models.append(model)
+            return model
+        set_llm_factory(recorded_factory)
+    if args.llm != "record":
+        # async_agent exige la llave aunque el replay nunca llame a OpenAI
+        os.environ.setdefault("OPENAI_API_KEY", "replay")
+
+    from langgraph.checkpoint.memory import MemorySaver
+    from async_agent import graph
+
+    compiled = graph.compile(checkpointer=MemorySaver())
+    semaphore = asyncio.Semaphore(args.concurrency)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(replay_thread(compiled, t, semaphore) for t in threads))
+    elapsed = time.perf_counter() - start
+    report = {"summary": summarize(results), "threads": results}
+
+    summary = report["summary"]
+    print(f"Replayed {summary['threads']} threads in {elapsed:.2f}s ({summary['completed']} completed)")
+    for metric in METRICS:
+        if summary[metric]:
+            print(f"  {metric:<20} mean {summary[metric]['mean']:.3f}  total {summary[metric]['total']:.3f}")
+    if models:
+        print(f"  recorded misses      {sum(m.misses for m in models)}")
+    errors = [r for r in results if r["error"]]
+    for r in errors:
+        print(f"  error in {r['thread_id']}: {r['error']}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.time_threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
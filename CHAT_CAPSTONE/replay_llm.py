@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+# Tools que no cierran una etapa: el modelo las usa antes de la herramienta de parseo
+AUXILIARY_TOOLS = ("verify_selfreport", "send_alert")
+
+
+def count_tokens(text: Any) -> int:
+    text = text if isinstance(text, str) else json.dumps(text, ensure_ascii=False, default=str)
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+class LLMUsageCallback(AsyncCallbackHandler):
+    """Cuenta llamadas al modelo y tokens de prompt de un thread."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], **kwargs) -> None:
+        self.calls += 1
+        self.prompt_tokens += sum(count_tokens(m.content) for batch in messages for m in batch)
+
+
+def _tool_call_message(name: str, args: Dict[str, Any], call_id: str) -> AIMessage:
+    # process_questionary_agent lee el formato OpenAI desde additional_kwargs
+    return AIMessage(
+        content="",
+        additional_kwargs={"tool_calls": [{
+            "id": call_id,
+            "type": "function",
+            "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)},
+        }]},
+        tool_calls=[{"name": name, "args": args, "id": call_id}],
+    )
+
+
+class FakeQuestionaryChatModel(BaseChatModel):
+    """LLM local y determinista que recorre el cuestionario como lo haría el modelo real.
+
+    - En emociones llama primero a verify_selfreport.
+    - Ante un mensaje del paciente llama a la herramienta de parseo de la etapa con
+      argumentos válidos según su schema.
+    - En cualquier otro caso responde con una pregunta de texto.
+    """
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-questionary"
+
+    def bind_tools(self, tools, **kwargs):
+        kwargs.pop("strict", None)
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    @staticmethod
+    def _fill_args(parameters: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+        args = {}
+        for name, spec in parameters.get("properties", {}).items():
+            if "enum" in spec:
+                args[name] = spec["enum"][0]
+            elif name == "user_id":
+                args[name] = int(user_id) if spec.get("type") == "integer" else user_id
+            elif spec.get("type") == "integer":
+                args[name] = 1
+            else:
+                args[name] = "no aplica"
+        return args
+
+    def respond(self, messages: List[BaseMessage], tools: List[Dict[str, Any]]) -> AIMessage:
+        functions = {t["function"]["name"]: t["function"] for t in tools}
+        user_id = "1"
+        for m in messages:
+            if isinstance(m, SystemMessage):
+                match = re.search(r"el id del paciente es (\S+)", m.content)
+                if match:
+                    user_id = match.group(1)
+        conversation = [m for m in messages if not isinstance(m, SystemMessage)]
+        call_id = f"call_{len(conversation)}"
+        verified = any(isinstance(m, ToolMessage) and m.name == "verify_selfreport" for m in conversation)
+        if "verify_selfreport" in functions and not verified:
+            return _tool_call_message("verify_selfreport", {"user_id": int(user_id)}, call_id)
+        last = conversation[-1] if conversation else None
+        stage_tools = [name for name in functions if name not in AUXILIARY_TOOLS]
+        if isinstance(last, HumanMessage) and stage_tools:
+            parameters = functions[stage_tools[0]].get("parameters", {})
+            return _tool_call_message(stage_tools[0], self._fill_args(parameters, user_id), call_id)
+        return AIMessage(content="¿Podrías contarme un poco más?")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self.respond(messages, kwargs.get("tools", []))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class ResponseStore:
+    """Respuestas grabadas del modelo en JSONL, indexadas por conversación y tools.
+
+    La llave ignora los mensajes de sistema para que un cambio de prompt no
+    invalide las grabaciones de las conversaciones.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.responses: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.responses[record["key"]] = record["message"]
+
+    @staticmethod
+    def key(messages: List[BaseMessage], tools: List[Dict[str, Any]]) -> str:
+        conversation = [
+            [m.type, m.content if isinstance(m.content, str) else json.dumps(m.content, default=str)]
+            for m in messages if not isinstance(m, SystemMessage)
+        ]
+        names = sorted(t["function"]["name"] for t in tools)
+        raw = json.dumps([conversation, names], ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        record = self.responses.get(key)
+        return messages_from_dict([record])[0] if record is not None else None
+
+    def put(self, key: str, message: AIMessage) -> None:
+        record = message_to_dict(message)
+        self.responses[key] = record
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "message": record}, ensure_ascii=False) + "\n")
+
+
+class RecordedChatModel(BaseChatModel):
+    """Sirve respuestas desde un ResponseStore.
+
+    Si falta una respuesta y hay un modelo real (inner) la graba; si no, cae al
+    FakeQuestionaryChatModel y lo cuenta en misses.
+    """
+
+    store: Any
+    inner: Optional[Any] = None
+    fallback: Any = None
+    misses: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "recorded"
+
+    def bind_tools(self, tools, **kwargs):
+        kwargs.pop("strict", None)
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _bind_inner(self, tools, kwargs):
+        # Mismas opciones de tool calling que pidió el agente (p.ej. parallel_tool_calls=False)
+        options = {key: kwargs[key] for key in ("tool_choice", "parallel_tool_calls") if key in kwargs}
+        return self.inner.bind_tools(tools, **options)
+
+    def _lookup(self, messages, tools):
+        key = ResponseStore.key(messages, tools)
+        return key, self.store.get(key)
+
+    def _miss(self, messages, tools) -> AIMessage:
+        self.misses += 1
+        fallback = self.fallback or FakeQuestionaryChatModel()
+        return fallback.respond(messages, tools)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tools = kwargs.get("tools", [])
+        key, message = self._lookup(messages, tools)
+        if message is None:
+            if self.inner is not None:
+                message = (self._bind_inner(tools, kwargs) if tools else self.inner).invoke(messages)
+                self.store.put(key, message)
+            else:
+                message = self._miss(messages, tools)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tools = kwargs.get("tools", [])
+        key, message = self._lookup(messages, tools)
+        if message is None:
+            if self.inner is not None:
+                message = await (self._bind_inner(tools, kwargs) if tools else self.inner).ainvoke(messages)
+                self.store.put(key, message)
+            else:
+                message = self._miss(messages, tools)
+        return ChatResult(generations=[ChatGeneration(message=message)])
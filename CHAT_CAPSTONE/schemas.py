@@ -33,7 +33,13 @@ class UserInput(BaseModel):
         description="User ID to track the user in the conversation.",
         examples=["7"],
     )
-    
+    idempotency_key: Optional[str] = Field(
+        description="Client-supplied key to make retries of the same turn free. "
+        "A retry with the same thread_id and key returns the original result.",
+        default=None,
+        examples=["c1d7a9e0-3b1f-4a5e-9f6e-2d8b7c4a1e55"],
+    )
+
 
 
 class StreamInput(UserInput):
@@ -45,6 +51,21 @@ class StreamInput(UserInput):
     )
 
 
+class BatchInput(BaseModel):
+    """Bulk conversation turns for the batch endpoint."""
+
+    items: List[UserInput] = Field(
+        description="Turns to run. Items sharing a thread_id run in order; different threads run in parallel.",
+        min_length=1,
+    )
+    max_concurrency: Optional[int] = Field(
+        description="Maximum number of threads processed at the same time for this batch.",
+        default=None,
+        ge=1,
+        examples=[8],
+    )
+
+
 class AgentResponse(BaseModel):
     """Response from the agent when called via /invoke."""
 
@@ -127,40 +148,50 @@ class ChatMessage(BaseModel):
         lc_msg.pretty_print()
 
 
+# Valores permitidos de cada slot. Se envían como enum en tools estrictas y
+# normalization.py repara localmente los valores que no calzan exactamente.
+Estado = Literal["muy mal", "mal", "regular", "bien", "muy bien"]
+Emocion = Literal["alegría", "miedo", "tristeza", "frustración", "rabia"]
+SiNo = Literal["si", "no"]
+SiNoNoAplica = Literal["si", "no", "no aplica"]
+EfectoEjercicio = Literal["muy mal", "mal", "regular", "bien", "muy bien", "no aplica"]
+IntensidadDolor = Literal["1", "2", "3", "4", "5", "6", "7", "8", "9", "10"]
+CalidadSueno = Literal["muy mala", "mala", "buena", "muy buena", "excelente"]
+
 class IDusuario(BaseModel):
     """id del usuario"""
     user_id: int = Field(description="Id del paciente")
 
 class AtributosPacientes(BaseModel):
     """Estado general del paciente"""
-    estado: str = Field(description="Interpretación del estado general del paciente identificado de la conversación.Puede ser solo uno de los siguientes valores: muy mal, mal, regular, bien, muy bien")
-    emociones: str = Field(description="Interpretación de la emoción general del paciente identificada en la conversación. Puede ser solo uno de los siguientes valores: alegría, miedo, tristeza, frustración, rabia")
-    medicamentos: str = Field(description="Interpretación de si el paciente tomó medicamentos. Puede ser solo uno de los siguientes valores: si, no")
+    estado: Estado = Field(description="Interpretación del estado general del paciente identificado de la conversación.Puede ser solo uno de los siguientes valores: muy mal, mal, regular, bien, muy bien")
+    emociones: Emocion = Field(description="Interpretación de la emoción general del paciente identificada en la conversación. Puede ser solo uno de los siguientes valores: alegría, miedo, tristeza, frustración, rabia")
+    medicamentos: SiNo = Field(description="Interpretación de si el paciente tomó medicamentos. Puede ser solo uno de los siguientes valores: si, no")
     efectos_adversos: str = Field(description="Interpretación de si el paciente sufrió efectos adversos por los medicamentos, si no aplica como el valor: no aplica")
     razon_no_medicamentos: str = Field(description="Razón por la cual el paciente no tomó sus medicamentos, si no aplica toma el valor: no aplica")
-    intensidad_dolor: str = Field(description="Interpretacion de la intensidad del dolor sufrida por el paciente. valor valido: 1 a 10")
-    realiza_ejercicios: str = Field(description="Interpretacion de si el paciente realizó los ejercicios recomendados. valor valido: si, no")
-    efecto_ejercicios: str = Field(description="Interpretacion de como se ha sentido el paciente despues de los ejercicios. Puede ser solo uno de los siguientes valores: muy mal, mal, regular, bien, muy bien")
+    intensidad_dolor: IntensidadDolor = Field(description="Interpretacion de la intensidad del dolor sufrida por el paciente. valor valido: 1 a 10")
+    realiza_ejercicios: SiNo = Field(description="Interpretacion de si el paciente realizó los ejercicios recomendados. valor valido: si, no")
+    efecto_ejercicios: EfectoEjercicio = Field(description="Interpretacion de como se ha sentido el paciente despues de los ejercicios. Puede ser solo uno de los siguientes valores: muy mal, mal, regular, bien, muy bien, si no aplica toma el valor: no aplica")
     razon_no_ejercicio: str = Field(description="Motivos por los cuales el paciente no realizó sus ejercicios, si no aplica, toma el valor: no aplica")
-    calidad_sueño: str = Field(description="Cual fue la calidad de sueño del paciente la noche anterior. valor valido: muy mala, mala, buena, muy buena, excenlente")
+    calidad_sueño: CalidadSueno = Field(description="Cual fue la calidad de sueño del paciente la noche anterior. valor valido: muy mala, mala, buena, muy buena, excelente")
     user_id: str = Field(description="Id del paciente")
 
 class parse_estado_general(BaseModel):
     """Transferir datos a asistente encargado de preguntas de medicamentos"""
-    estado: str = Field(description="Interpretación del estado general del paciente identificado de la conversación.Puede ser solo uno de los siguientes valores: muy mal, mal, regular, bien, muy bien")
-    emociones: str = Field(description="Interpretación de la emoción general del paciente identificada en la conversación. Puede ser solo uno de los siguientes valores: alegría, miedo, tristeza, frustración, rabia")
+    estado: Estado = Field(description="Interpretación del estado general del paciente identificado de la conversación.Puede ser solo uno de los siguientes valores: muy mal, mal, regular, bien, muy bien")
+    emociones: Emocion = Field(description="Interpretación de la emoción general del paciente identificada en la conversación. Puede ser solo uno de los siguientes valores: alegría, miedo, tristeza, frustración, rabia")
 
     class Config:
         json_schema_extra = {
             "example": {
                 "estado": "muy bien",
-                "emociones": "alegria"
+                "emociones": "alegría"
             }
         }
 
 class parse_medicamentos(BaseModel):
     """Transferir datos a asistente encargado de preguntas del dolor"""
-    medicamentos: str = Field(description="Interpretación de si el paciente tomó medicamentos. Puede ser solo uno de los siguientes valores: si, no")
+    medicamentos: SiNo = Field(description="Interpretación de si el paciente tomó medicamentos. Puede ser solo uno de los siguientes valores: si, no")
     efectos_adversos: str = Field(description="Interpretación de si el paciente sufrió efectos adversos por los medicamentos, si no aplica como el valor: no aplica")
     razon_no_medicamentos: str = Field(description="Razón por la cual el paciente no tomó sus medicamentos, si no aplica toma el valor: no aplica")
 
@@ -180,9 +211,9 @@ class parse_medicamentos(BaseModel):
 
 class parse_dolor(BaseModel):
     """Transferir datos a asistente encargado de preguntas de ejercicio"""
-    intensidad_dolor: str = Field(description="Interpretacion de la intensidad del dolor sufrida por el paciente. valor valido: 1 a 10")
-    medicamento_sos: str = Field(description="Interpretación de si el paciente ha tomado su medicamento S.O.S,los valores validos son: si, no, no aplica")
-    alerta_sos: str = Field(description="Interpretacion si se emitió una alerta o no, los valores validos son: si, no, no aplica")
+    intensidad_dolor: IntensidadDolor = Field(description="Interpretacion de la intensidad del dolor sufrida por el paciente. valor valido: 1 a 10")
+    medicamento_sos: SiNoNoAplica = Field(description="Interpretación de si el paciente ha tomado su medicamento S.O.S,los valores validos son: si, no, no aplica")
+    alerta_sos: SiNoNoAplica = Field(description="Interpretacion si se emitió una alerta o no, los valores validos son: si, no, no aplica")
 
     class Config:
         json_schema_extra = {
@@ -205,8 +236,8 @@ class parse_dolor(BaseModel):
 
 class parse_ejercicio(BaseModel):
     """Transferir datos a asistente encargado de preguntas del sueño"""
-    realiza_ejercicios: str = Field(description="Interpretacion de si el paciente realizó los ejercicios recomendados. valor valido: si, no")
-    efecto_ejercicios: str = Field(description="Interpretacion de como se ha sentido el paciente despues de los ejercicios. Puede ser solo uno de los siguientes valores: muy mal, mal, regular, bien, muy bien")
+    realiza_ejercicios: SiNo = Field(description="Interpretacion de si el paciente realizó los ejercicios recomendados. valor valido: si, no")
+    efecto_ejercicios: EfectoEjercicio = Field(description="Interpretacion de como se ha sentido el paciente despues de los ejercicios. Puede ser solo uno de los siguientes valores: muy mal, mal, regular, bien, muy bien, si no aplica toma el valor: no aplica")
     razon_no_ejercicio: str = Field(description="Motivos por los cuales el paciente no realizó sus ejercicios, si no aplica, toma el valor: no aplica")
 
     class Config:
@@ -225,7 +256,7 @@ class parse_ejercicio(BaseModel):
 
 class parse_sueno(BaseModel):
     """Transferir datos a asistente encargado de preguntas del sueño"""
-    calidad_sueno: str = Field(description="Cual fue la calidad de sueño del paciente la noche anterior. valor valido: muy mala, mala, buena, muy buena, excelente")
+    calidad_sueno: CalidadSueno = Field(description="Cual fue la calidad de sueño del paciente la noche anterior. valor valido: muy mala, mala, buena, muy buena, excelente")
     horas_sueño: str = Field(description="Cantidad de horas de sueño del paciente la noche anterior. valor valido: numero de 1 a 24")
 
     class Config:
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Los módulos de CHAT_CAPSTONE se importan planos (from schemas import ...), igual que en benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
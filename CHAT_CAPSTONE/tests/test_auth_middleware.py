@@ -0,0 +1,55 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from middleware import AuthMiddleware
+
+
+async def echo(websocket):
+    await websocket.accept()
+    await websocket.send_text("ok")
+    await websocket.close()
+
+
+def make_client():
+    app = Starlette(routes=[
+        Route("/health", lambda request: PlainTextResponse("ok")),
+        Route("/private", lambda request: PlainTextResponse("ok")),
+        WebSocketRoute("/ws", echo),
+    ])
+    app.add_middleware(AuthMiddleware, secret="s3cret")
+    return TestClient(app)
+
+
+def test_http_requires_bearer_token():
+    client = make_client()
+    assert client.get("/health").status_code == 200
+    assert client.get("/private").status_code == 401
+    assert client.get("/private", headers={"Authorization": "Bearer nope"}).status_code == 401
+    assert client.get("/private", headers={"Authorization": "Bearer s3cret"}).status_code == 200
+
+
+def test_websocket_accepts_header_token():
+    with make_client().websocket_connect("/ws", headers={"Authorization": "Bearer s3cret"}) as ws:
+        assert ws.receive_text() == "ok"
+
+
+def test_websocket_accepts_bearer_subprotocol():
+    with make_client().websocket_connect("/ws", subprotocols=["bearer", "s3cret"]) as ws:
+        assert ws.accepted_subprotocol == "bearer"
+        assert ws.receive_text() == "ok"
+
+
+@pytest.mark.parametrize("url, subprotocols", [
+    ("/ws?token=s3cret", None),
+    ("/ws", ["bearer", "nope"]),
+    ("/ws", ["s3cret"]),
+])
+def test_websocket_rejects_query_and_bad_tokens(url, subprotocols):
+    kwargs = {"subprotocols": subprotocols} if subprotocols else {}
+    with pytest.raises(WebSocketDisconnect):
+        with make_client().websocket_connect(url, **kwargs) as ws:
+            ws.receive_text()
@@ -0,0 +1,70 @@
+import json
+import os
+
+os.environ.setdefault("CHECKPOINTER_BACKEND", "memory")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from replay_llm import FakeQuestionaryChatModel  # noqa: E402
+from utils import set_llm_factory  # noqa: E402
+
+set_llm_factory(FakeQuestionaryChatModel)
+import app as app_module  # noqa: E402
+
+
+def post_batch(client, items):
+    headers = {"Authorization": f"Bearer {app_module.AUTH_SECRET}"} if app_module.AUTH_SECRET else {}
+    response = client.post("/batch/invoke", json={"items": items}, headers=headers)
+    assert response.status_code == 200
+    return sorted((json.loads(line) for line in response.text.splitlines()), key=lambda line: line["index"])
+
+
+def test_batch_runs_each_thread_in_order():
+    items = [
+        {"message": "hola", "user_id": "1", "thread_id": "b1"},
+        {"message": "bien", "user_id": "1", "thread_id": "b1"},
+        {"message": "hola", "user_id": "2", "thread_id": "b2"},
+    ]
+    with TestClient(app_module.app) as client:
+        lines = post_batch(client, items)
+    assert [line["status"] for line in lines] == ["ok", "ok", "ok"]
+    assert [line["thread_id"] for line in lines] == ["b1", "b1", "b2"]
+
+
+def test_unexpected_errors_become_error_lines(monkeypatch):
+    submit = app_module._submit_turn
+
+    async def flaky_submit(user_input, stream_tokens, log_updates=False):
+        if user_input.message == "boom":
+            raise RuntimeError("unexpected failure")
+        return await submit(user_input, stream_tokens, log_updates)
+
+    monkeypatch.setattr(app_module, "_submit_turn", flaky_submit)
+    items = [
+        {"message": "hola", "user_id": "1", "thread_id": "e1"},
+        {"message": "boom", "user_id": "1", "thread_id": "e1"},
+        {"message": "si", "user_id": "1", "thread_id": "e1"},
+        {"message": "hola", "user_id": "2", "thread_id": "e2"},
+    ]
+    with TestClient(app_module.app) as client:
+        lines = post_batch(client, items)
+    assert [line["status"] for line in lines] == ["ok", "error", "ok", "ok"]
+    assert lines[1]["error"] == "unexpected failure"
+
+
+def test_group_failure_reports_remaining_items(monkeypatch):
+    class BrokenSlots:
+        async def __aenter__(self):
+            raise RuntimeError("no slots")
+
+        async def __aexit__(self, *exc):
+            return False
+
+    items = [
+        {"message": "hola", "user_id": "1", "thread_id": "g1"},
+        {"message": "bien", "user_id": "1", "thread_id": "g1"},
+    ]
+    with TestClient(app_module.app) as client:
+        monkeypatch.setattr(app_module.app.state, "batch_slots", BrokenSlots())
+        lines = post_batch(client, items)
+    assert [(line["status"], line["error"]) for line in lines] == [("error", "no slots")] * 2
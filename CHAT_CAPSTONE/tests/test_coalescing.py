@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from coalescing import ThreadBusyError, ThreadRunRegistry, turn_fingerprint
+
+
+def gated_producer(gate: asyncio.Event, calls: list, result="respuesta"):
+    async def producer(run):
+        calls.append(run.run_id)
+        await run.publish({"type": "message", "content": run.run_id})
+        await gate.wait()
+        await run.finish(result=result)
+
+    return producer
+
+
+def test_duplicate_submission_attaches_to_inflight_run():
+    async def scenario():
+        registry = ThreadRunRegistry()
+        gate, calls = asyncio.Event(), []
+        fingerprint = turn_fingerprint("1", "hola", "gpt")
+        first, created = await registry.submit("t", fingerprint, "r1", gated_producer(gate, calls))
+        second, attached = await registry.submit("t", fingerprint, "r2", gated_producer(gate, calls))
+        gate.set()
+        events = [event async for event in second.subscribe()]
+        return first, created, second, attached, calls, events, await first.wait_result()
+
+    first, created, second, attached, calls, events, result = asyncio.run(scenario())
+    assert created and not attached
+    assert second is first
+    assert calls == ["r1"]
+    assert events == [{"type": "message", "content": "r1"}]
+    assert result == "respuesta"
+
+
+def test_different_message_waits_for_current_turn():
+    async def scenario():
+        registry = ThreadRunRegistry(busy_policy="wait", busy_timeout=5)
+        gate, calls = asyncio.Event(), []
+        first, _ = await registry.submit("t", turn_fingerprint("1", "hola", "gpt"), "r1", gated_producer(gate, calls))
+        waiting = asyncio.create_task(
+            registry.submit("t", turn_fingerprint("1", "bien", "gpt"), "r2", gated_producer(asyncio.Event(), calls))
+        )
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        gate.set()
+        second, created = await waiting
+        return first, second, created, calls
+
+    first, second, created, calls = asyncio.run(scenario())
+    assert created and second is not first
+    assert first.done.is_set()
+    assert calls == ["r1", "r2"]
+
+
+def test_different_message_is_rejected_with_reject_policy():
+    async def scenario():
+        registry = ThreadRunRegistry(busy_policy="reject")
+        gate = asyncio.Event()
+        await registry.submit("t", turn_fingerprint("1", "hola", "gpt"), "r1", gated_producer(gate, []))
+        try:
+            with pytest.raises(ThreadBusyError):
+                await registry.submit("t", turn_fingerprint("1", "bien", "gpt"), "r2", gated_producer(gate, []))
+            # Otro thread no se ve afectado
+            _, created = await registry.submit("u", turn_fingerprint("1", "bien", "gpt"), "r3", gated_producer(gate, []))
+            return created
+        finally:
+            gate.set()
+
+    assert asyncio.run(scenario())
+
+
+def test_waiting_for_busy_thread_times_out():
+    async def scenario():
+        registry = ThreadRunRegistry(busy_policy="wait", busy_timeout=0.05)
+        gate = asyncio.Event()
+        await registry.submit("t", turn_fingerprint("1", "hola", "gpt"), "r1", gated_producer(gate, []))
+        try:
+            with pytest.raises(ThreadBusyError, match="Timed out"):
+                await registry.submit("t", turn_fingerprint("1", "bien", "gpt"), "r2", gated_producer(gate, []))
+        finally:
+            gate.set()
+
+    asyncio.run(scenario())
+
+
+def test_idempotency_key_replays_result_within_ttl(monkeypatch):
+    async def scenario():
+        registry = ThreadRunRegistry(result_ttl=60)
+        gate, calls = asyncio.Event(), []
+        gate.set()
+        fingerprint = turn_fingerprint("1", "hola", "gpt", idempotency_key="abc")
+        first, _ = await registry.submit("t", fingerprint, "r1", gated_producer(gate, calls))
+        await first.wait_result()
+        await asyncio.sleep(0)
+        replay, created = await registry.submit("t", fingerprint, "r2", gated_producer(gate, calls))
+        # Vencido el TTL el mismo envío se vuelve a ejecutar
+        first.finished_at -= 61
+        rerun, rerun_created = await registry.submit("t", fingerprint, "r3", gated_producer(gate, calls))
+        await rerun.wait_result()
+        return first, replay, created, rerun, rerun_created, calls
+
+    first, replay, created, rerun, rerun_created, calls = asyncio.run(scenario())
+    assert replay is first and not created
+    assert rerun_created and rerun is not first
+    assert calls == ["r1", "r3"]
+
+
+def test_failed_runs_are_not_cached():
+    async def scenario():
+        registry = ThreadRunRegistry()
+        calls = []
+
+        async def failing(run):
+            calls.append(run.run_id)
+            raise RuntimeError("llm down")
+
+        fingerprint = turn_fingerprint("1", "hola", "gpt", idempotency_key="abc")
+        first, _ = await registry.submit("t", fingerprint, "r1", failing)
+        await first.wait_result()
+        await asyncio.sleep(0)
+        retry, created = await registry.submit("t", fingerprint, "r2", failing)
+        await retry.wait_result()
+        return first, retry, created, calls
+
+    first, retry, created, calls = asyncio.run(scenario())
+    assert first.error == "llm down"
+    assert created and retry is not first
+    assert calls == ["r1", "r2"]
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+import db
+
+
+def test_statement_key_uses_main_table():
+    assert db.statement_key("SELECT thread_id FROM checkpoints WHERE thread_id = %s") == "select checkpoints"
+    assert db.statement_key("INSERT INTO checkpoint_writes VALUES (%s)") == "insert checkpoint_writes"
+
+
+def test_pool_check_query_is_not_recorded(monkeypatch):
+    monkeypatch.setattr(db, "statement_stats", type(db.statement_stats)(db.statement_stats.default_factory))
+    db.record_statement("", 0.001)
+    db.record_statement("SELECT 1 FROM checkpoints", 0.002)
+    assert list(db.statement_stats) == ["select checkpoints"]
+
+
+def test_check_pool_periodically_keeps_running_after_errors():
+    class FakePool:
+        def __init__(self):
+            self.checks = 0
+
+        async def check(self):
+            self.checks += 1
+            if self.checks == 1:
+                raise OSError("connection reset")
+
+    async def scenario():
+        pool = FakePool()
+        task = asyncio.create_task(db.check_pool_periodically(pool, interval=0.01))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return pool.checks
+
+    assert asyncio.run(scenario()) >= 2
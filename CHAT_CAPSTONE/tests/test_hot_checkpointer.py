@@ -0,0 +1,131 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from hot_checkpointer import CheckpointPersistError, HotCheckpointer
+from replay_llm import FakeQuestionaryChatModel, LLMUsageCallback
+from utils import set_llm_factory
+
+
+class SlowSaver(MemorySaver):
+    """MemorySaver cuyas escrituras tardan, para abrir una ventana durante el flush."""
+
+    def __init__(self, delay=0.05):
+        super().__init__()
+        self.delay = delay
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        await asyncio.sleep(self.delay)
+        return await super().aput(config, checkpoint, metadata, new_versions)
+
+
+class FailingSaver(MemorySaver):
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        raise RuntimeError("db down")
+
+
+def compiled_graph(checkpointer):
+    set_llm_factory(FakeQuestionaryChatModel)
+    from async_agent import graph
+
+    return graph.compile(checkpointer=checkpointer)
+
+
+async def run_turn(agent, thread_id, message):
+    # Los callbacks en el config no son copiables: reproduce el fallo del segundo turno
+    config = {"configurable": {"thread_id": thread_id}, "callbacks": [LLMUsageCallback()]}
+    return await agent.ainvoke({"messages": [HumanMessage(content=message)], "user_id": "1"}, config)
+
+
+def test_pinned_thread_runs_several_turns_and_persists_them():
+    async def scenario():
+        durable = MemorySaver()
+        hot = HotCheckpointer(durable)
+        agent = compiled_graph(hot)
+        thread_id = str(uuid4())
+        hot.pin(thread_id)
+        for message in ["hola", "bien", "si"]:
+            state = await run_turn(agent, thread_id, message)
+            await hot.flush(thread_id)
+        await hot.release(thread_id)
+        stored = await durable.aget_tuple({"configurable": {"thread_id": thread_id}})
+        return state, stored
+
+    state, stored = asyncio.run(scenario())
+    assert state["stage"] == 3
+    assert stored.checkpoint["channel_values"]["stage"] == 3
+    assert len(stored.checkpoint["channel_values"]["messages"]) == len(state["messages"])
+
+
+def test_cached_state_is_isolated_from_graph_mutations():
+    async def scenario():
+        hot = HotCheckpointer(MemorySaver())
+        agent = compiled_graph(hot)
+        thread_id = str(uuid4())
+        hot.pin(thread_id)
+        await run_turn(agent, thread_id, "hola")
+        state = await run_turn(agent, thread_id, "bien")
+        state["slots"]["estado"] = "mutado"
+        cached = await hot.aget_tuple({"configurable": {"thread_id": thread_id}})
+        await hot.release(thread_id)
+        return cached
+
+    cached = asyncio.run(scenario())
+    assert cached.checkpoint["channel_values"]["slots"]["estado"] != "mutado"
+
+
+def test_pin_during_release_flush_is_kept():
+    async def scenario():
+        hot = HotCheckpointer(SlowSaver())
+        agent = compiled_graph(hot)
+        thread_id = str(uuid4())
+        hot.pin(thread_id)
+        await run_turn(agent, thread_id, "hola")
+        # Sesión A suelta el thread mientras quedan escrituras; sesión B lo fija en medio
+        release = asyncio.create_task(hot.release(thread_id))
+        await asyncio.sleep(0)
+        hot.pin(thread_id)
+        await release
+        pinned = hot._pins.get(thread_id)
+        has_worker = thread_id in hot._workers
+        await run_turn(agent, thread_id, "bien")
+        await hot.release(thread_id)
+        return pinned, has_worker, hot._pins.get(thread_id), thread_id in hot._workers
+
+    pinned, has_worker, after_pins, after_worker = asyncio.run(scenario())
+    assert pinned == 1 and has_worker
+    assert after_pins is None and not after_worker
+
+
+def test_persist_failure_is_raised_on_flush_and_release():
+    async def scenario():
+        hot = HotCheckpointer(FailingSaver())
+        agent = compiled_graph(hot)
+        thread_id = str(uuid4())
+        hot.pin(thread_id)
+        await run_turn(agent, thread_id, "hola")
+        with pytest.raises(CheckpointPersistError):
+            await hot.flush(thread_id)
+        await run_turn(agent, thread_id, "bien")
+        with pytest.raises(CheckpointPersistError):
+            await hot.release(thread_id)
+        return thread_id in hot._workers
+
+    assert asyncio.run(scenario()) is False
+
+
+def test_unpinned_threads_go_straight_to_the_durable_saver():
+    async def scenario():
+        durable = MemorySaver()
+        hot = HotCheckpointer(durable)
+        agent = compiled_graph(hot)
+        thread_id = str(uuid4())
+        await run_turn(agent, thread_id, "hola")
+        return hot._latest, await durable.aget_tuple({"configurable": {"thread_id": thread_id}})
+
+    latest, stored = asyncio.run(scenario())
+    assert latest == {}
+    assert stored is not None
@@ -0,0 +1,39 @@
+import asyncio
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from replay_llm import FakeQuestionaryChatModel, LLMUsageCallback, _tool_call_message
+from utils import set_llm_factory
+
+
+class VerifyLoopModel(FakeQuestionaryChatModel):
+    """Modelo que pide verify_selfreport en cada llamada."""
+
+    def respond(self, messages, tools):
+        return _tool_call_message("verify_selfreport", {"user_id": 1}, f"call_{uuid4().hex[:8]}")
+
+
+def test_inline_tool_loop_is_bounded(monkeypatch):
+    set_llm_factory(FakeQuestionaryChatModel)
+    import async_agent
+    from schemas import parse_estado_general
+    from tools import get_patient_last_report
+
+    # Los agentes se construyen al importar async_agent: se reemplaza solo el de emociones
+    set_llm_factory(VerifyLoopModel)
+    monkeypatch.setattr(async_agent, "questionary_agent_emotions", async_agent.define_questionary_agent(
+        async_agent.questionary_agent_suffix_emotions, [parse_estado_general, get_patient_last_report]
+    ))
+    set_llm_factory(FakeQuestionaryChatModel)
+    agent = async_agent.graph.compile(checkpointer=MemorySaver())
+    usage = LLMUsageCallback()
+    config = {"configurable": {"thread_id": str(uuid4())}, "callbacks": [usage]}
+    state = asyncio.run(asyncio.wait_for(
+        agent.ainvoke({"messages": [HumanMessage(content="hola")], "user_id": "1"}, config), timeout=10
+    ))
+    last = state["messages"][-1]
+    assert isinstance(last, AIMessage) and not last.tool_calls
+    assert last.content == async_agent.INLINE_TOOLS_FALLBACK
+    assert usage.calls == async_agent.MAX_INLINE_TOOL_ROUNDS + 1
@@ -0,0 +1,89 @@
+import pytest
+
+from normalization import SYNONYMS, normalize_slots
+
+BASE_ARGS = {
+    "parse_estado_general": {"estado": "bien", "emociones": "alegría"},
+    "parse_medicamentos": {"medicamentos": "si", "efectos_adversos": "no aplica", "razon_no_medicamentos": "no aplica"},
+    "parse_dolor": {"intensidad_dolor": "5", "medicamento_sos": "no", "alerta_sos": "no"},
+    "parse_ejercicio": {"realiza_ejercicios": "si", "efecto_ejercicios": "bien", "razon_no_ejercicio": "no aplica"},
+    "parse_sueno": {"calidad_sueno": "buena", "horas_sueño": "8"},
+}
+
+# (herramienta, campo, valor del modelo, valor normalizado)
+REPAIRS = [
+    ("parse_estado_general", "estado", "Muy bueno", "muy bien"),
+    ("parse_estado_general", "estado", "REGULAR ", "regular"),
+    ("parse_estado_general", "emociones", "alegria", "alegría"),
+    ("parse_estado_general", "emociones", "frustrado", "frustración"),
+    ("parse_estado_general", "emociones", "tristesa", "tristeza"),  # typo, difflib
+    ("parse_medicamentos", "medicamentos", "Sí", "si"),
+    ("parse_medicamentos", "medicamentos", "ninguno", "no"),
+    ("parse_dolor", "intensidad_dolor", "7/10", "7"),
+    ("parse_dolor", "intensidad_dolor", "siete", "7"),
+    ("parse_dolor", "intensidad_dolor", "un 10", "10"),
+    ("parse_dolor", "medicamento_sos", "ninguno", "no"),
+    ("parse_dolor", "alerta_sos", "n/a", "no aplica"),
+    ("parse_ejercicio", "efecto_ejercicios", "nada", "no aplica"),
+    ("parse_sueno", "calidad_sueno", "excenlente", "excelente"),
+    ("parse_sueno", "calidad_sueno", "bien", "buena"),
+    ("parse_sueno", "calidad_sueno", "muy bien", "muy buena"),
+    ("parse_sueno", "horas_sueño", "8 horas", "8"),
+    ("parse_sueno", "horas_sueño", "7,5", "7.5"),
+    ("parse_sueno", "horas_sueño", "seis", "6"),
+]
+
+# (herramienta, campo, valor irreparable)
+ERRORS = [
+    ("parse_estado_general", "estado", "quizas"),
+    ("parse_estado_general", "emociones", "neutral"),
+    ("parse_dolor", "intensidad_dolor", "15"),
+    ("parse_dolor", "intensidad_dolor", "mucho"),
+    ("parse_sueno", "horas_sueño", "0"),
+    ("parse_sueno", "horas_sueño", "25 horas"),
+    ("parse_sueno", "calidad_sueno", "regular"),
+]
+
+
+@pytest.mark.parametrize("tool_name, args", BASE_ARGS.items())
+def test_valid_args_pass_unchanged(tool_name, args):
+    result = normalize_slots(tool_name, args)
+    assert result.slots == args
+    assert result.repaired == [] and result.errors == []
+
+
+@pytest.mark.parametrize("tool_name, field, value, expected", REPAIRS)
+def test_repairs(tool_name, field, value, expected):
+    result = normalize_slots(tool_name, {**BASE_ARGS[tool_name], field: value})
+    assert result.errors == []
+    assert result.slots[field] == expected
+    assert field in result.repaired
+
+
+@pytest.mark.parametrize("tool_name, field, value", ERRORS)
+def test_unrepairable_values_are_reported(tool_name, field, value):
+    result = normalize_slots(tool_name, {**BASE_ARGS[tool_name], field: value})
+    assert len(result.errors) == 1 and result.errors[0].startswith(field)
+
+
+def test_free_text_fields_are_only_trimmed():
+    result = normalize_slots("parse_medicamentos", {**BASE_ARGS["parse_medicamentos"], "efectos_adversos": "  náuseas leves "})
+    assert result.slots["efectos_adversos"] == "náuseas leves"
+    assert result.errors == []
+
+
+def test_unknown_tools_pass_through():
+    assert normalize_slots("verify_selfreport", {"user_id": 1}).slots == {"user_id": 1}
+
+
+def test_synonyms_have_a_single_canonical_value_per_field_type():
+    # Dentro de un mismo conjunto de opciones un sinónimo no puede apuntar a dos canónicos
+    choice_sets = [["si", "no", "no aplica"], ["muy mal", "mal", "regular", "bien", "muy bien", "no aplica"],
+                   ["muy mala", "mala", "buena", "muy buena", "excelente"]]
+    for choices in choice_sets:
+        seen = {}
+        for canonical, synonyms in SYNONYMS.items():
+            if canonical not in choices:
+                continue
+            for synonym in synonyms:
+                assert seen.setdefault(synonym, canonical) == canonical, synonym
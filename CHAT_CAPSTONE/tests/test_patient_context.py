@@ -0,0 +1,73 @@
+import asyncio
+
+from patient_context import PatientContextPrefetcher
+
+
+def counting_fetch(calls):
+    async def fetch(user_id):
+        calls.append(user_id)
+        await asyncio.sleep(0.01)
+        return f"reporte {user_id}"
+    return fetch
+
+
+def test_prefetch_only_for_threads_not_seen_before():
+    async def scenario():
+        calls = []
+        prefetcher = PatientContextPrefetcher(fetch=counting_fetch(calls))
+        first = prefetcher.start("t1", "1")
+        report = await prefetcher.take("t1", "1")
+        # Turnos siguientes del mismo thread no vuelven a consultar
+        again = prefetcher.start("t1", "1")
+        return first, again, report, calls, prefetcher.stats()
+
+    first, again, report, calls, stats = asyncio.run(scenario())
+    assert first is not None and again is None
+    assert report == "reporte 1" and calls == ["1"]
+    assert stats["hits"] == 1 and stats["pending"] == 0
+
+
+def test_discard_only_cancels_the_callers_task():
+    async def scenario():
+        calls = []
+        prefetcher = PatientContextPrefetcher(fetch=counting_fetch(calls))
+        stale = prefetcher.start("t1", "1")
+        await prefetcher.take("t1", "1")
+        # Se olvida el thread (como al salir del LRU) y un turno nuevo lo vuelve a precargar
+        prefetcher._seen.pop("t1")
+        owner = prefetcher.start("t1", "1")
+        # Un request con una tarea que ya no es la registrada no cancela ni olvida nada
+        prefetcher.discard("t1", stale)
+        report = await prefetcher.take("t1", "1")
+        restarted = prefetcher.start("t1", "1")
+        return owner, restarted, report, calls
+
+    owner, restarted, report, calls = asyncio.run(scenario())
+    assert not owner.cancelled()
+    assert restarted is None
+    assert report == "reporte 1" and calls == ["1", "1"]
+
+
+def test_discard_by_owner_cancels_and_forgets_the_thread():
+    async def scenario():
+        prefetcher = PatientContextPrefetcher(fetch=counting_fetch([]))
+        owner = prefetcher.start("t1", "1")
+        prefetcher.discard("t1", owner)
+        await asyncio.sleep(0)
+        return owner, prefetcher.start("t1", "1")
+
+    owner, again = asyncio.run(scenario())
+    assert owner.cancelled()
+    assert again is not None
+
+
+def test_unused_prefetch_expires():
+    async def scenario():
+        prefetcher = PatientContextPrefetcher(fetch=counting_fetch([]), ttl=0)
+        prefetcher.start("t1", "1")
+        await asyncio.sleep(0.001)
+        prefetcher.start("t2", "1")
+        return prefetcher.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["expired"] == 1 and stats["pending"] == 1
@@ -0,0 +1,48 @@
+import asyncio
+import operator
+from typing import Annotated, List, TypedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, StateGraph
+
+from replay import load_saved_threads
+
+
+class BaselineState(TypedDict):
+    messages: Annotated[List[BaseMessage], operator.add]
+    user_id: str
+
+
+def baseline_node(state: BaselineState):
+    # Como el grafo original: devuelve el historial completo a un reducer operator.add
+    return {"messages": state["messages"] + [AIMessage(content="¿Cómo te sientes?")]}
+
+
+def baseline_graph(saver):
+    graph = StateGraph(BaselineState)
+    graph.add_node("questionary", baseline_node)
+    graph.set_entry_point("questionary")
+    graph.add_edge("questionary", END)
+    return graph.compile(checkpointer=saver)
+
+
+def test_load_saved_threads_rebuilds_turns_from_baseline_thread():
+    async def scenario():
+        saver = MemorySaver()
+        graph = baseline_graph(saver)
+        for thread_id, user_id, messages in [("t1", "7", ["hola", "bien", "hola"]), ("t2", "8", ["mal"])]:
+            config = {"configurable": {"thread_id": thread_id}}
+            for message in messages:
+                await graph.ainvoke({"messages": [HumanMessage(content=message)], "user_id": user_id}, config)
+        state = await graph.aget_state({"configurable": {"thread_id": "t1"}})
+        humans = [m.content for m in state.values["messages"] if isinstance(m, HumanMessage)]
+        return humans, await load_saved_threads(saver, "memory", limit=None)
+
+    humans, threads = asyncio.run(scenario())
+    # El historial guardado repite mensajes; el replay debe ver solo lo que envió el paciente
+    assert len(humans) > 3
+    assert sorted(threads, key=lambda t: t["thread_id"]) == [
+        {"thread_id": "t1", "user_id": "7", "messages": ["hola", "bien", "hola"]},
+        {"thread_id": "t2", "user_id": "8", "messages": ["mal"]},
+    ]
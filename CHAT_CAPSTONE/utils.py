@@ -3,9 +3,39 @@ from langchain.prompts import (
     ChatPromptTemplate,
     MessagesPlaceholder,
 )
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_openai import ChatOpenAI
 from prompts import questionary_agent_prefix
 
+# Las tools se atan con parallel_tool_calls=False: OpenAI no garantiza el schema
+# estricto en llamadas paralelas y cada etapa procesa solo la primera tool call.
+# Palabras clave de JSON Schema aceptadas en el nivel superior de una tool estricta;
+# el resto (p.ej. los ejemplos de json_schema_extra) se descarta.
+STRICT_SCHEMA_KEYS = {"type", "properties", "required", "additionalProperties", "description", "$defs"}
+
+_llm_factory = None
+
+def set_llm_factory(factory):
+    """Reemplaza el LLM de los agentes (p.ej. por el modelo de replay).
+
+    Los agentes se construyen al importar async_agent, así que debe llamarse antes.
+    """
+    global _llm_factory
+    _llm_factory = factory
+
+def strict_tool(tool):
+    """Definición OpenAI estricta de la tool: el modelo solo puede emitir valores del enum."""
+    formatted = convert_to_openai_tool(tool, strict=True)
+    parameters = formatted["function"]["parameters"]
+    for key in [key for key in parameters if key not in STRICT_SCHEMA_KEYS]:
+        del parameters[key]
+    return formatted
+
+def _build_llm():
+    if _llm_factory is not None:
+        return _llm_factory()
+    return ChatOpenAI(model="gpt-4o", temperature=0, max_tokens=None, timeout=None, max_retries=2,)
+
 def define_questionary_agent(questionary_agent_suffix, tools):
     prompt_questionary= ChatPromptTemplate.from_messages(
             [
@@ -16,9 +46,11 @@ def define_questionary_agent(questionary_agent_suffix, tools):
             ]
         )
 
-    llm = ChatOpenAI(model="gpt-4o", temperature=0, max_tokens=None, timeout=None, max_retries=2,)
+    llm = _build_llm()
     if tools:
-        questionary_agent = prompt_questionary | llm.bind_tools(tools)
+        questionary_agent = prompt_questionary | llm.bind_tools(
+            [strict_tool(t) for t in tools], strict=True, parallel_tool_calls=False
+        )
     else:
         questionary_agent = prompt_questionary | llm
     return questionary_agent
@@ -35,9 +67,11 @@ def define_questionary_agent_with_slots(questionary_agent_suffix, tools):
             ]
         )
 
-    llm = ChatOpenAI(model="gpt-4o", temperature=0, max_tokens=None, timeout=None, max_retries=2,)
+    llm = _build_llm()
     if tools:
-        questionary_agent = prompt_questionary | llm.bind_tools(tools)
+        questionary_agent = prompt_questionary | llm.bind_tools(
+            [strict_tool(t) for t in tools], strict=True, parallel_tool_calls=False
+        )
     else:
         questionary_agent = prompt_questionary | llm
     return questionary_agent
\ No newline at end of file